@@ -0,0 +1,271 @@
+# coding=utf-8
+# benchmarks of the hot paths of moldy on generated molecules and files,
+# written as JSON so that runs can be compared, e.g.
+#
+#   python bench.py -o before.json
+#   python bench.py -o after.json --compare before.json
+#
+# molecules are jittered carbon lattices with 1.4 A spacing, so every atom
+# has a few bonds like in real structures. Benchmarks whose optional
+# dependencies (cclib, prettytable, Qt/OpenGL) are missing are recorded as
+# skipped. The scene benchmarks build the molecule in an offscreen
+# MyGLView; without a display run them under Xvfb
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import numpy as np
+import core
+from core import xyz2zmat, zmat2xyz, zmat2array, zarray2xyz, getBonds, writeOutput, spectrumGrid, spectrum
+
+defaultSizes = [10, 100, 1000, 10000, 50000]
+carbonRadius = .76
+# the QApplication of the scene benchmarks; Qt deletes the views with it
+app = None
+
+# 'n' atoms on a jittered cubic lattice
+def molecule(n, seed=0):
+    side = int(np.ceil(n**(1/3.)))
+    grid = np.indices((side,)*3).reshape(3, -1).T[:n]
+    rng = np.random.RandomState(seed)
+    return grid*1.4 + rng.normal(scale=.05, size=(n, 3))
+
+def writeXYZ(filename, frames, atoms):
+    with open(filename, 'w') as f:
+        for xyz in frames:
+            f.write('%d\nframe\n' % len(xyz))
+            for a, (x, y, z) in zip(atoms, xyz):
+                f.write('%-2s %14.8f %14.8f %14.8f\n' % (a, x, y, z))
+
+# a Gaussian optimization log with 'steps' geometries of 'xyz' with
+# Standard orientation blocks, SCF energies and convergence tables
+def writeGaussianLog(filename, xyz, steps=10):
+    dashes = ' ' + '-'*69 + '\n'
+    with open(filename, 'w') as f:
+        f.write(' Entering Gaussian System, Link 0=g16\n Gaussian 16:  ES64L-G16RevA.03 25-Dec-2016\n')
+        for step in range(steps):
+            f.write('                         Standard orientation:\n')
+            f.write(dashes)
+            f.write(' Center     Atomic      Atomic             Coordinates (Angstroms)\n')
+            f.write(' Number     Number       Type             X           Y           Z\n')
+            f.write(dashes)
+            for i, (x, y, z) in enumerate(xyz + .001*step):
+                f.write(' %6d %10d %11d %15.6f %11.6f %11.6f\n' % (i+1, 6, 0, x, y, z))
+            f.write(dashes)
+            f.write(' SCF Done:  E(RB3LYP) =  %.9f     A.U. after   12 cycles\n' % (-38.*len(xyz) - .01*step))
+            f.write('         Item               Value     Threshold  Converged?\n')
+            for item, target in zip(['Maximum Force', 'RMS     Force', 'Maximum Displacement', 'RMS     Displacement'], [.00045, .0003, .0018, .0012]):
+                f.write(' %-24s %8.6f %12.6f     NO\n' % (item, .01/(step+1), target))
+        f.write(' Normal termination of Gaussian 16\n')
+
+# every benchmark takes the molecule size and a scratch directory, does its
+# setup and returns the function to time
+def benchXyz2zmat(n, tmp):
+    xyz, atoms = molecule(n), ['C']*n
+    return lambda: xyz2zmat(xyz, atoms)
+
+def benchZmat2xyz(n, tmp):
+    zmat = xyz2zmat(molecule(n), ['C']*n)
+    return lambda: zmat2xyz(zmat)
+
+# the conversion updateView does, from the Z-matrix table's array
+def benchZarray2xyz(n, tmp):
+    zmat = zmat2array(xyz2zmat(molecule(n), ['C']*n))
+    return lambda: zarray2xyz(zmat)
+
+def benchBonds(n, tmp):
+    vs, r = molecule(n), np.full(n, carbonRadius)
+    return lambda: getBonds(vs, r)
+
+# opening a trajectory of 10 frames (indexing it) and reading the first
+def benchReadXYZ(n, tmp):
+    from trajectory import XYZTrajectory, indexPath
+    filename = os.path.join(tmp, 'bench%d.xyz' % n)
+    xyz = molecule(n)
+    writeXYZ(filename, [ xyz + .01*i for i in range(10) ], ['C']*n)
+    def read():
+        if os.path.exists(indexPath(filename)):
+            os.remove(indexPath(filename))
+        with XYZTrajectory(filename) as trajectory:
+            return trajectory[0]
+    return read
+
+def benchGaussianTail(n, tmp):
+    from gaussian import GaussianTail
+    import cclib
+    filename = os.path.join(tmp, 'bench%d.log' % n)
+    writeGaussianLog(filename, molecule(n))
+    return lambda: GaussianTail(filename).read()
+
+# a full cclib parse; the cache is cleared before every run
+def benchReadGaussian(n, tmp):
+    import gaussian
+    import cclib
+    filename = os.path.join(tmp, 'bench%d.log' % n)
+    writeGaussianLog(filename, molecule(n))
+    gaussian.cacheDir = os.path.join(tmp, 'cache')
+    def read():
+        path = gaussian.cachePath(filename)
+        if os.path.exists(path):
+            os.remove(path)
+        return gaussian.readGaussianLog(filename)
+    return read
+
+def benchWriteOutput(n, tmp):
+    import prettytable
+    zmat = xyz2zmat(molecule(n), ['C']*n)
+    filename = os.path.join(tmp, 'bench%d.zmat' % n)
+    # writeOutput pads the rows it is given
+    return lambda: writeOutput([ list(row) for row in zmat ], filename)
+
+# IR and Raman spectra of the 3n-6 modes of an n atom molecule
+def benchSpectrum(n, tmp):
+    rng = np.random.RandomState(0)
+    nmodes = max(3*n-6, 1)
+    freqs = np.sort(rng.uniform(20, 4000, nmodes))
+    x = spectrumGrid(freqs)
+    ys = rng.uniform(0, 100, (2, nmodes))
+    return lambda: [ spectrum(x, freqs, y) for y in ys ]
+
+def offscreenMolecule(n):
+    global app
+    from PyQt4.QtGui import QApplication
+    import render
+    app = QApplication.instance() or QApplication(sys.argv)
+    vs = molecule(n)
+    vs -= vs.mean(axis=0)
+    r = [carbonRadius]*n
+    c = [core.colors[5][-1]]*n
+    view = render.offscreenView()
+    render.fitCamera(view, vs)
+    return view, vs, r, c
+
+# building the scene of updateView: bonds and the batched meshes. The
+# molecule is cleared first, as setting the same one again only updates
+def benchScene(n, tmp):
+    view, vs, r, c = offscreenMolecule(n)
+    def build():
+        view.clearMolecule()
+        view.setMolecule(vs, r, c, getBonds(vs, r))
+    return build
+
+# drawing the built scene into an offscreen framebuffer
+def benchRender(n, tmp):
+    view, vs, r, c = offscreenMolecule(n)
+    view.setMolecule(vs, r, c, getBonds(vs, r))
+    view.renderToArray((640, 480))
+    return lambda: view.renderToArray((640, 480))
+
+# name, function and the largest molecule worth timing; frequency jobs and
+# prettytable output of more atoms are impractically slow
+benchmarks = [
+    ('xyz2zmat', benchXyz2zmat, None),
+    ('zmat2xyz', benchZmat2xyz, None),
+    ('zarray2xyz', benchZarray2xyz, None),
+    ('bonds', benchBonds, None),
+    ('readXYZ', benchReadXYZ, None),
+    ('gaussianTail', benchGaussianTail, None),
+    ('readGaussian', benchReadGaussian, None),
+    ('writeOutput', benchWriteOutput, 10000),
+    ('spectrum', benchSpectrum, 1000),
+    ('scene', benchScene, None),
+    ('render', benchRender, None),
+]
+
+# seconds per call of 'func': the number of calls per measurement is
+# chosen so that one measurement takes at least 0.2 s, then 'repeat'
+# measurements are made
+def timeCall(func, repeat):
+    timer = timeit.Timer(func)
+    number = timer.autorange()[0]
+    return number, [ t/number for t in timer.repeat(repeat, number) ]
+
+def versions():
+    info = {'python': platform.python_version(), 'platform': platform.platform(), 'numpy': np.__version__}
+    for name in ['scipy', 'pyqtgraph', 'cclib', 'prettytable']:
+        try:
+            info[name] = __import__(name).__version__
+        except Exception:
+            pass
+    try:
+        info['commit'] = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+def run(names, sizes, repeat, log=sys.stderr):
+    results = []
+    tmp = tempfile.mkdtemp(prefix='moldybench')
+    try:
+        for name, bench, maxAtoms in benchmarks:
+            if name not in names:
+                continue
+            for n in sizes:
+                if maxAtoms and n > maxAtoms:
+                    continue
+                result = {'name': name, 'atoms': n}
+                # only missing dependencies skip a benchmark; anything else
+                # is a bug and fails the run
+                try:
+                    number, times = timeCall(bench(n, tmp), repeat)
+                except ImportError as err:
+                    result['skipped'] = '%s: %s' % (type(err).__name__, err)
+                    log.write('%-14s %6d  skipped (%s)\n' % (name, n, result['skipped']))
+                    results.append(result)
+                    # the other sizes would fail the same way
+                    break
+                result.update(number=number, times=times, best=min(times), median=float(np.median(times)))
+                log.write('%-14s %6d  %10.3f ms\n' % (name, n, 1e3*result['best']))
+                results.append(result)
+    finally:
+        for root, dirs, files in os.walk(tmp, topdown=False):
+            for name in files:
+                os.remove(os.path.join(root, name))
+            os.rmdir(root)
+    return results
+
+# best times of 'results' against those of an earlier run
+def compare(results, baseline, log=sys.stderr):
+    before = { (b['name'], b['atoms']): b['best'] for b in baseline['results'] if 'best' in b }
+    for result in results:
+        key = (result['name'], result['atoms'])
+        if 'best' in result and key in before:
+            log.write('%-14s %6d  %10.3f ms -> %10.3f ms  x%.2f\n' % (key[0], key[1], 1e3*before[key], 1e3*result['best'], before[key]/result['best']))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark moldy on generated molecules and files.')
+    parser.add_argument('-o', '--output', help='JSON file for the results (default: standard output)')
+    parser.add_argument('--only', help='comma separated benchmarks to run: '+', '.join(b[0] for b in benchmarks))
+    parser.add_argument('--sizes', help='comma separated molecule sizes in atoms (default: %s)' % ','.join(map(str, defaultSizes)))
+    parser.add_argument('--repeat', type=int, default=5, help='measurements per benchmark (default: 5)')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare with')
+    args = parser.parse_args(argv)
+    names = [ b[0] for b in benchmarks ]
+    if args.only:
+        unknown = set(args.only.split(',')) - set(names)
+        if unknown:
+            parser.error('unknown benchmarks '+', '.join(sorted(unknown)))
+        names = args.only.split(',')
+    sizes = [ int(n) for n in args.sizes.split(',') ] if args.sizes else defaultSizes
+
+    started = time.time()
+    results = run(names, sizes, args.repeat)
+    report = {'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(started)), 'seconds': time.time()-started, 'repeat': args.repeat, 'versions': versions(), 'results': results}
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+        sys.stdout.write('\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,114 @@
+# coding=utf-8
+# convert molecule files without the GUI, e.g. to turn a directory of XYZ
+# files into Z-matrices using 8 processes:
+#
+#   python convert.py --to zmat -o zmats -j 8 structures/
+#
+# inputs are .xyz (the frame given by --frame of trajectories), .zmat and
+# Gaussian .log files (the geometry given by --frame). Every file is read,
+# converted and written by a worker process, so results go to disk as soon
+# as they are ready and nothing large is sent back to the main process
+import argparse
+import os
+import sys
+from collections import Counter
+from multiprocessing import Pool
+import numpy as np
+from core import xyz2zmat, zmat2xyz, readZmatFile, writeOutput
+from trajectory import XYZTrajectory
+
+inputTypes = ('.xyz', '.zmat', '.log')
+
+# read a molecule; returns the element symbols, coordinates and for
+# Z-matrix files the Z-matrix rows
+def readMolecule(filename, frame=-1):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.zmat':
+        zmat = readZmatFile(filename)
+        return [ row[0] for row in zmat ], zmat2xyz(zmat), zmat
+    if ext == '.log':
+        from gaussian import readGaussianLog
+        from periodictable import elements
+        data = readGaussianLog(filename)
+        return [ str(elements[e]) for e in data['atomnos'] ], data['atomcoords'][frame], None
+    with XYZTrajectory(filename) as trajectory:
+        elems, xyz = trajectory[frame]
+    # unreadable XYZ files come back as one frame without atoms
+    if len(elems) == 0:
+        raise ValueError('no atoms found')
+    return elems, xyz, None
+
+# convert one file; runs in the worker processes. Returns the input name
+# and an error message or None
+def convertFile(task):
+    src, dst, to, frame = task
+    try:
+        elems, xyz, zmat = readMolecule(src, frame)
+        if to == 'zmat':
+            rows = zmat if zmat is not None else xyz2zmat(xyz, elems)
+        else:
+            rows = [ [e] + np.round(v, 7).tolist() for e, v in zip(elems, xyz) ]
+        # write next to the output first so that no partial files are left
+        # behind if the job is killed
+        writeOutput(rows, dst+'.tmp')
+        os.replace(dst+'.tmp', dst)
+    except Exception as err:
+        return src, '%s: %s' % (type(err).__name__, err)
+    return src, None
+
+# input files given on the command line with their output names; files in
+# directories are collected by extension, keeping the directory structure
+# below 'outdir' when recursing
+def collectTasks(paths, to, outdir=None, recursive=False, frame=-1):
+    tasks = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                if not recursive:
+                    dirs[:] = []
+                for name in sorted(files):
+                    if name.lower().endswith(inputTypes):
+                        rel = os.path.relpath(root, path)
+                        tasks.append((os.path.join(root, name), os.path.join(outdir, rel) if outdir else root))
+                dirs.sort()
+        else:
+            tasks.append((path, outdir or os.path.dirname(path)))
+    return [ (src, os.path.join(d, os.path.splitext(os.path.basename(src))[0]+'.'+to), to, frame) for src, d in tasks ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert .xyz, .zmat and Gaussian .log files to XYZ or Z-matrix files.')
+    parser.add_argument('paths', nargs='+', help='input files or directories')
+    parser.add_argument('-t', '--to', choices=['xyz', 'zmat'], default='zmat', help='output format (default: zmat)')
+    parser.add_argument('-o', '--outdir', help='output directory (default: next to the inputs)')
+    parser.add_argument('-r', '--recursive', action='store_true', help='also convert files in subdirectories')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--frame', type=int, default=-1, help='frame of trajectories and Gaussian logs to convert (default: -1, the last)')
+    parser.add_argument('--skip-existing', action='store_true', help='skip inputs whose output is newer than the input')
+    args = parser.parse_args(argv)
+
+    tasks = collectTasks(args.paths, args.to, args.outdir, args.recursive, args.frame)
+    dups = sorted( o for o, n in Counter( t[1] for t in tasks ).items() if n > 1 )
+    if dups:
+        parser.error('several inputs would be written to '+', '.join(dups))
+    clash = [ t[0] for t in tasks if os.path.abspath(t[0]) == os.path.abspath(t[1]) ]
+    if clash:
+        parser.error('output would overwrite input '+', '.join(clash))
+    if args.skip_existing:
+        tasks = [ t for t in tasks if not (os.path.exists(t[1]) and os.path.getmtime(t[1]) >= os.path.getmtime(t[0])) ]
+    for d in set( os.path.dirname(t[1]) for t in tasks ):
+        if d and not os.path.isdir(d):
+            os.makedirs(d)
+
+    failed = 0
+    jobs = max(1, min(args.jobs or 1, len(tasks)))
+    chunksize = max(1, min(64, len(tasks)//(4*jobs)))
+    with Pool(jobs) as pool:
+        for src, error in pool.imap_unordered(convertFile, tasks, chunksize):
+            if error:
+                failed += 1
+                sys.stderr.write('%s: %s\n' % (src, error))
+    sys.stderr.write('%d of %d files converted\n' % (len(tasks)-failed, len(tasks)))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,451 @@
+import csv
+import os
+import sys
+import numpy as np
+from math import acos, sin
+from numpy.linalg import norm
+from functools import lru_cache
+
+# numeric core of moldy: coordinate conversion, bonding, formulas and
+# spectra. It only needs numpy; scipy and prettytable are imported when
+# first used, so headless tools can import it without the GUI libraries
+
+# data files are looked up next to the modules, or in the PyInstaller
+# bundle when frozen
+def resourcePath(name):
+    return os.path.join(getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__))), name)
+
+# import element colors
+colors = []
+with open(resourcePath('colors.csv')) as csvfile:
+    csvreader = csv.reader(csvfile)
+    for row in csvreader:
+        colors.append([int(row[0]), row[1], (float(row[2])/255, float(row[3])/255, float(row[4])/255, 1)])
+
+# find bonded atom pairs; atoms are bonded when closer than 1.25*(r_i+r_j).
+# A KD-tree limits the search to pairs within the largest possible cutoff,
+# so this runs in near-linear time instead of testing every pair. Small
+# molecules simply test all pairs, which is quicker than importing scipy
+bondDtype = np.dtype([('i', int), ('j', int), ('length', float)])
+densePairs = 256
+def getBonds(vs, r):
+    vs = np.asarray(vs, dtype=float).reshape(-1, 3)
+    r = np.asarray(r, dtype=float)
+    if len(vs) < 2:
+        return np.zeros(0, dtype=bondDtype)
+    if len(vs) <= densePairs:
+        pairs = np.transpose(np.triu_indices(len(vs), 1))
+    else:
+        from scipy.spatial import cKDTree
+        pairs = cKDTree(vs).query_pairs(2.5*r.max(), output_type='ndarray')
+        pairs = pairs.reshape(-1, 2)
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+    lengths = norm(vs[pairs[:, 0]] - vs[pairs[:, 1]], axis=1)
+    keep = lengths < (r[pairs[:, 0]] + r[pairs[:, 1]])*1.25
+    bonds = np.zeros(np.count_nonzero(keep), dtype=bondDtype)
+    bonds['i'] = pairs[keep, 0]
+    bonds['j'] = pairs[keep, 1]
+    bonds['length'] = lengths[keep]
+    return bonds
+
+# raised when a Zmatrix can't be converted to XYZ coordinates
+class ZMError(Exception):
+    pass
+
+# place atoms from their reference atoms a, b, c and bond, angle and
+# dihedral values; works on whole arrays of atoms and conformers at once
+def nerf(a, b, c, bond, angle, dihedral):
+    bc = a - b
+    bc /= norm(bc, axis=-1)[..., None]
+    n = np.cross(b - c, bc)
+    n /= norm(n, axis=-1)[..., None]
+    m = np.cross(n, bc)
+    sa = np.sin(angle)
+    d = np.stack([-np.cos(angle), sa*np.cos(dihedral), sa*np.sin(dihedral)], axis=-1)
+    return a + bond[..., None]*(d[..., 0, None]*bc + d[..., 1, None]*m + d[..., 2, None]*n)
+
+# Zmatrix conversion plan, built once per topology ('zslots' holds the
+# 0-based reference atoms of every row). The first atom is put in the
+# origin, the second on the z axis and the third in the xz plane. The
+# rest are grouped into levels whose references are all placed by earlier
+# levels, so every level is placed in one vectorized step
+class ZMatPlan(object):
+    def __init__(self, zslots):
+        self.natoms = n = len(zslots)
+        self.refs = np.zeros((n, 3), dtype=int)
+        level = np.zeros(n, dtype=int)
+        for i, slots in enumerate(zslots):
+            slots = tuple(slots)
+            if len(slots) != min(i, 3):
+                raise ZMError('row %d needs %d reference atoms' % (i+1, min(i, 3)))
+            if len(set(slots)) != len(slots) or any(s < 0 or s >= i for s in slots):
+                raise ZMError('row %d has invalid reference atoms' % (i+1))
+            self.refs[i, :len(slots)] = slots
+            if i >= 3:
+                level[i] = 1 + level[list(slots)].max()
+        self.levels = [ np.flatnonzero(level == l) for l in range(1, level.max()+1) ] if n > 3 else []
+
+    # 'values' holds bond, angle and dihedral (in radians) for every atom,
+    # shaped (natoms, 3) or stacked as (..., natoms, 3) for many conformers
+    def __call__(self, values):
+        values = np.asarray(values, dtype=float)
+        if values.shape[-2:] != (self.natoms, 3):
+            raise ZMError('expected values shaped (..., %d, 3)' % self.natoms)
+        if self.natoms == 0:
+            return np.zeros(values.shape)
+        vals = values.reshape(-1, self.natoms, 3)
+        xyz = np.zeros(vals.shape)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.place(xyz, vals)
+        if not np.all(np.isfinite(xyz)):
+            raise ZMError('reference atoms are linear or overlapping')
+        return xyz.reshape(values.shape)
+
+    def place(self, xyz, vals):
+        if self.natoms > 1:
+            xyz[:, 1, 2] = vals[:, 1, 0]
+        if self.natoms > 2:
+            a, b = xyz[:, self.refs[2, 0]], xyz[:, self.refs[2, 1]]
+            c = b + [1., 0., 0.]
+            xyz[:, 2] = nerf(a, b, c, vals[:, 2, 0], vals[:, 2, 1], np.zeros(len(vals)))
+        for idx in self.levels:
+            r = self.refs[idx]
+            xyz[:, idx] = nerf(xyz[:, r[:, 0]], xyz[:, r[:, 1]], xyz[:, r[:, 2]], vals[:, idx, 0], vals[:, idx, 1], vals[:, idx, 2])
+
+@lru_cache(maxsize=32)
+def zmatPlan(zslots):
+    return ZMatPlan(zslots)
+
+# convert between Zmatrix and XYZ coordinates
+def zmat2xyz(data):
+    zslots = tuple( tuple(int(s)-1 for s in row[1::2]) for row in data )
+    values = np.zeros((len(data), 3))
+    for i, row in enumerate(data):
+        if len(row[2::2]) != len(zslots[i]):
+            raise ZMError('row %d has missing values' % (i+1))
+        values[i, :len(zslots[i])] = row[2::2]
+    values[:, 1:] = np.radians(values[:, 1:])
+    return zmatPlan(zslots)(values)
+
+# Zmatrix held as a structured array: atomic number 'z' (0 if not given),
+# 0-based reference atoms 'refs' (-1 if not given) and bond, angle and
+# dihedral 'values' in angstrom and degrees (nan if not given)
+zmatDtype = np.dtype([('z', np.int16), ('refs', np.int32, 3), ('values', float, 3)])
+atomicNumbers = { symbol: z for z, symbol, color in colors }
+
+def elementNumber(symbol):
+    symbol = str(symbol).strip()
+    return atomicNumbers.get(symbol, atomicNumbers.get(symbol.capitalize(), 0))
+
+def emptyZmat(n):
+    zmat = np.zeros(n, dtype=zmatDtype)
+    zmat['refs'] = -1
+    zmat['values'] = np.nan
+    return zmat
+
+# rows of the array that are not completely empty
+def filledRows(zmat):
+    return (zmat['z'] > 0) | np.any(zmat['refs'] >= 0, axis=1) | np.any(~np.isnan(zmat['values']), axis=1)
+
+# convert between Zmatrix rows as read from files and the array
+def zmat2array(data):
+    zmat = emptyZmat(len(data))
+    for i, row in enumerate(data):
+        zmat['z'][i] = elementNumber(row[0])
+        zmat['refs'][i, :len(row[1::2])] = [ int(s)-1 for s in row[1::2] ]
+        zmat['values'][i, :len(row[2::2])] = row[2::2]
+    return zmat
+
+def array2zmat(zmat):
+    data = []
+    for i, (z, refs, values) in enumerate(zip(zmat['z'].tolist(), (zmat['refs']+1).tolist(), zmat['values'].tolist())):
+        row = [colors[z-1][1] if z > 0 else '']
+        # cells left empty are left out, as in the table
+        for j in range(min(i, 3)):
+            if refs[j] > 0:
+                row.append(refs[j])
+            if not np.isnan(values[j]):
+                row.append(values[j])
+        data.append(row)
+    return data
+
+# XYZ coordinates of a Zmatrix array, without going through the rows
+def zarray2xyz(zmat):
+    n = len(zmat)
+    if np.any(zmat['z'] <= 0):
+        raise ZMError('row %d has no known element' % (np.argmax(zmat['z'] <= 0)+1))
+    used = np.arange(3) < np.minimum(np.arange(n), 3)[:, None]
+    values = np.where(used, zmat['values'], 0.)
+    if np.any(np.isnan(values)):
+        raise ZMError('row %d has missing values' % (np.argmax(np.isnan(values).any(axis=1))+1))
+    values[:, 1:] = np.radians(values[:, 1:])
+    refs = zmat['refs'].tolist()
+    zslots = tuple( tuple(refs[i][:min(i, 3)]) for i in range(n) )
+    return zmatPlan(zslots)(values)
+
+# read a Zmatrix file written by writeOutput
+def readZmatFile(filename):
+    zmat = []
+    with open(filename, 'r') as f:
+        next(f)
+        next(f)
+        for row in f:
+            cells = row.split()
+            if cells:
+                zmat.append([cells[0]] + [ int(c) if j % 2 == 0 else float(c) for j, c in enumerate(cells[1:]) ])
+    return zmat
+
+# export data to text file arranged in nice columns
+def writeOutput(data, filename):
+    if len(data) > 0:
+        from prettytable import PrettyTable
+        t = PrettyTable()
+        maxLen = max([ len(row) for row in data ])
+        for row in data:
+            l = len(row)
+            if l < maxLen:
+                row += ['']*(maxLen - l)
+            t.add_row(row)
+        t.align = 'l'
+        t.header = False
+        t.border = False
+    else:
+        t = ''
+    with open(filename, 'w') as f:
+        f.write(str(len(data))+'\n')
+        f.write('\n')
+        f.write(str(t))
+        f.write('\n\n')
+    f.close()
+
+# try to guess the formula from elements; only usable for filename generation
+def getFormula(data):
+    d = ''
+    for i in set(data):
+        d += i
+        c = data.count(i)
+        if c > 1:
+            d += str(c)
+    return d
+
+# index of the atom nearest to 'point' among the first 'limit' atoms,
+# skipping the indices in 'exclude'. The KD-tree over all atoms is asked
+# for a few candidates; if none of them is placed yet, the placed atoms
+# are scanned directly
+def nearestPlaced(tree, A, point, limit, exclude=(), k=16):
+    idx = np.atleast_1d(tree.query(point, k=min(k, len(A)))[1])
+    for j in idx:
+        if j < limit and j not in exclude:
+            return int(j)
+    dist_2 = np.sum((A[:limit] - point)**2, axis=1)
+    dist_2[list(exclude)] = np.inf
+    return int(np.argmin(dist_2))
+
+# convert between XYZ and Zmatrix coordinates; every atom is bonded to the
+# nearest atom before it, the angle uses the atom nearest to that one and
+# the dihedral the next nearest, all chosen among the atoms before it.
+# 'progress' is called with the fraction of atoms done
+def xyz2zmat(xyz, atoms, progress=None):
+    A = np.asarray(xyz, dtype=float).reshape(-1, 3)
+    n = len(A)
+    if n == 0:
+        return []
+    from scipy.spatial import cKDTree
+    tree = cKDTree(A)
+    refs = np.zeros((n, 3), dtype=int)
+    for i in range(2, n):
+        if progress and i % 4096 == 0:
+            progress(float(i)/n, 'Converting to Zmatrix')
+        n1 = nearestPlaced(tree, A, A[i], i)
+        n2 = nearestPlaced(tree, A, A[n1], i, (n1,))
+        refs[i, :2] = n1, n2
+        if i > 2:
+            refs[i, 2] = nearestPlaced(tree, A, A[n2], i, (n1, n2))
+    # bond, angle and dihedral for all atoms at once
+    with np.errstate(invalid='ignore', divide='ignore'):
+        q = A - A[refs[:, 0]]
+        r = A[refs[:, 0]] - A[refs[:, 1]]
+        s = A[refs[:, 1]] - A[refs[:, 2]]
+        distance = norm(q, axis=1)
+        q_u = q / distance[:, None]
+        r_u = r / norm(r, axis=1)[:, None]
+        angle = np.degrees(np.arccos(np.clip(np.sum(-q_u*r_u, axis=1), -1, 1)))
+        plane1 = np.cross(q, r)
+        plane2 = np.cross(r, s)
+        cosd = np.sum(plane1*plane2, axis=1) / (norm(plane1, axis=1)*norm(plane2, axis=1))
+        dihedral = np.degrees(np.arccos(np.clip(cosd, -1, 1)))
+        dihedral[np.sum(np.cross(plane1, plane2)*r_u, axis=1) > 0] *= -1
+    values = np.c_[distance, angle, dihedral].tolist()
+    refs = (refs + 1).tolist()
+    zmat = [[atoms[0]]]
+    for i in range(1, n):
+        row = [atoms[i]]
+        for j in range(min(i, 3)):
+            row += [refs[i][j], values[i][j]]
+        zmat.append(row)
+    return zmat
+
+# geometries of a vibration with displacements 'disp' at the phases
+# 'phases' (radians); returns an array shaped phases.shape + (natoms, 3)
+def vibrationFrames(vs, disp, phases, amplitude=1/3.):
+    s = amplitude*np.sin(np.asarray(phases, dtype=float))[..., None, None]
+    return np.asarray(vs, dtype=float) + s*np.asarray(disp, dtype=float)
+
+# rotate and translate every frame of 'frames' (nframes, natoms, 3) onto
+# 'ref' (natoms, 3) with the least RMSD (Kabsch); all frames are aligned
+# in one batch of 3x3 SVDs
+def alignFrames(frames, ref):
+    frames = np.asarray(frames, dtype=float)
+    ref = np.asarray(ref, dtype=float)
+    P = frames - frames.mean(axis=-2, keepdims=True)
+    Q = ref - ref.mean(axis=0)
+    U, S, Vt = np.linalg.svd(np.einsum('fni,nj->fij', P, Q))
+    # no reflections
+    U[..., -1] *= np.sign(np.linalg.det(U @ Vt))[..., None]
+    return P @ (U @ Vt) + ref.mean(axis=0)
+
+# insert 'substeps'-1 linearly interpolated frames between every two
+# frames of 'frames' (nframes, natoms, 3)
+def interpolateFrames(frames, substeps):
+    frames = np.asarray(frames, dtype=float)
+    if substeps <= 1 or len(frames) < 2:
+        return frames
+    t = (np.arange(substeps)/float(substeps))[:, None, None]
+    steps = frames[:-1, None]*(1-t) + frames[1:, None]*t
+    return np.concatenate([steps.reshape((-1,) + frames.shape[1:]), frames[-1:]])
+
+def slerp(q0, r0, t):
+    q = np.array(q0)
+    r = np.array(r0)
+    l = (np.sqrt(np.dot(q, q))+np.sqrt(np.dot(r, r)))*.45
+    q_u = q / np.sqrt(np.dot(q, q))
+    r_u = r / np.sqrt(np.dot(r, r))
+    angle = acos(np.dot(q_u, r_u))
+    sa = sin(angle)
+    return sin((1.0-t)*angle)/sa*l * q_u + sin(t*angle)/sa*l * r_u
+
+# line shapes of unit height centred on 0; 'fwhm' is the full width at
+# half maximum. The offsets 'x' are overwritten with the result to save
+# temporaries on large grids
+def lorentzian(x, fwhm):
+    x *= 2/fwhm
+    x *= x
+    x += 1
+    return np.reciprocal(x, out=x)
+
+def gaussian(x, fwhm):
+    x *= np.sqrt(4*np.log(2))/fwhm
+    x *= x
+    np.negative(x, out=x)
+    return np.exp(x, out=x)
+
+lineShapes = {'Lorentzian': lorentzian, 'Gaussian': gaussian}
+# distance in FWHM beyond which a line shape is taken as 0; Gaussian lines
+# are below 1e-40 of their height there, Lorentzian tails are kept
+lineCutoffs = {'Gaussian': 6}
+
+# frequency grid covering all lines with 'margin' on either side, sampled
+# every 'resolution' and at the line positions so no peak is cut short
+def spectrumGrid(freqs, resolution=1., margin=100.):
+    freqs = np.asarray(freqs, dtype=float)
+    grid = np.arange(freqs.min()-margin, freqs.max()+margin+resolution/2, resolution)
+    return np.union1d(grid, freqs)
+
+# sum of the lines at 'freqs' with heights 'intensities' on the grid 'x'
+# (unsorted grids are sorted first). Lines are broadcast over the grid in blocks of about 'chunk'
+# elements which stay in the CPU cache; with a cutoff, every block of
+# (sorted) lines only touches the part of the grid it reaches
+spectrumChunk = 1 << 16
+
+def spectrum(x, freqs, intensities, fwhm=4*np.pi, shape='Lorentzian', chunk=spectrumChunk):
+    x = np.asarray(x, dtype=float)
+    if np.any(np.diff(x) < 0):
+        order = np.argsort(x)
+        y = np.empty(len(x))
+        y[order] = spectrum(x[order], freqs, intensities, fwhm, shape, chunk)
+        return y
+    freqs = np.asarray(freqs, dtype=float)
+    order = np.argsort(freqs)
+    freqs = freqs[order]
+    intensities = np.asarray(intensities, dtype=float)[order]
+    func = lineShapes[shape]
+    cutoff = lineCutoffs.get(shape)
+    y = np.zeros(len(x))
+    step = max(1, chunk//max(len(x), 1))
+    for lo in range(0, len(freqs), step):
+        f = freqs[lo:lo+step]
+        a, b = 0, len(x)
+        if cutoff is not None:
+            a, b = np.searchsorted(x, [f[0]-cutoff*fwhm, f[-1]+cutoff*fwhm])
+        y[a:b] += intensities[lo:lo+step] @ func(np.subtract(x[a:b], f[:, None]), fwhm)
+    return y
+
+# spectra of many molecules on one grid, e.g. of conformers to be compared
+# with one measurement; returns an array shaped (len(freqs), len(x))
+def spectra(x, freqs, intensities, fwhm=4*np.pi, shape='Lorentzian'):
+    return np.array([ spectrum(x, f, i, fwhm, shape) for f, i in zip(freqs, intensities) ]).reshape(-1, len(x))
+
+# interpolate a spectrum onto 'grid'; it is 0 outside of the measured range
+def resampleSpectrum(x, y, grid):
+    x = np.asarray(x, dtype=float)
+    order = np.argsort(x)
+    return np.interp(grid, x[order], np.asarray(y, dtype=float)[order], left=0., right=0.)
+
+# trapezoidal integration weights of the points of a sorted grid
+def gridWeights(x):
+    dx = np.diff(np.asarray(x, dtype=float))
+    w = np.zeros(len(x))
+    w[:-1] += dx/2
+    w[1:] += dx/2
+    return w
+
+# score spectra 'ys' (one per row) against the reference spectrum 'ref',
+# all on the grid 'x'. Returns the overlap of the area-normalized spectra
+# (1 for identical shapes, 0 for no common signal) and their cosine
+# similarity, each with one value per row of 'ys'
+def compareSpectra(x, ref, ys):
+    x = np.asarray(x, dtype=float)
+    order = np.argsort(x)
+    w = gridWeights(x[order])
+    ref = np.clip(np.asarray(ref, dtype=float)[order], 0, None)
+    ys = np.clip(np.asarray(ys, dtype=float).reshape(-1, len(x))[:, order], 0, None)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        refn = ref/(ref @ w)
+        ysn = ys/(ys @ w)[:, None]
+        overlap = np.minimum(ysn, refn) @ w
+        cosine = (ys*ref) @ w/np.sqrt((ys*ys) @ w*((ref*ref) @ w))
+    return np.nan_to_num(overlap), np.nan_to_num(cosine)
+
+# read a measured spectrum from a .npy file holding two columns or from a
+# text file with frequency and intensity columns separated by whitespace,
+# commas or semicolons; lines that do not start with two numbers (headers,
+# comments) are skipped. Returns frequencies and intensities sorted by
+# frequency
+def readSpectrum(filename):
+    if filename.lower().endswith('.npy'):
+        data = np.load(filename)
+    else:
+        rows = []
+        with open(filename) as f:
+            for line in f:
+                cells = line.replace(',', ' ').replace(';', ' ').split()
+                try:
+                    rows.append([float(cells[0]), float(cells[1])])
+                except (IndexError, ValueError):
+                    pass
+        data = np.array(rows).reshape(-1, 2)
+    # frequencies and the first spectrum; writeSpectrum may add more columns
+    data = np.asarray(data, dtype=float)
+    if data.ndim != 2 or data.shape[1] < 2:
+        raise ValueError('expected columns of frequency and intensity')
+    data = data[:, :2]
+    data = data[np.argsort(data[:, 0])]
+    return data[:, 0], data[:, 1]
+
+# write spectra sharing the grid 'x' as columns of a CSV or .npy file
+def writeSpectrum(filename, x, ys, names):
+    data = np.column_stack([x] + list(ys))
+    if filename.lower().endswith('.npy'):
+        np.save(filename, data)
+    else:
+        np.savetxt(filename, data, delimiter=',', header=','.join(['frequency'] + list(names)), comments='')
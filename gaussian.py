@@ -0,0 +1,165 @@
+import hashlib
+import io
+import os
+import numpy as np
+
+# parsing big Gaussian logs with cclib is slow, so the arrays moldy uses are
+# cached as .npz files keyed on the path, size and mtime of the log and the
+# cclib version. The cache is limited to 'cacheSize' bytes; entries are
+# touched when read and the least recently used ones are removed first
+cacheDir = os.path.join(os.path.expanduser('~'), '.cache', 'moldy')
+cacheSize = 512 << 20
+cacheKeys = ['natom', 'atomnos', 'atomcoords', 'scfenergies', 'geovalues', 'geotargets', 'vibfreqs', 'vibirs', 'vibramans', 'vibdisps']
+
+def cclibVersion():
+    try:
+        from importlib.metadata import version
+        return version('cclib')
+    except Exception:
+        import cclib
+        return cclib.__version__
+
+def cachePath(filename, stat=None):
+    stat = stat or os.stat(filename)
+    key = '%s|%d|%d|%s' % (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, cclibVersion())
+    return os.path.join(cacheDir, hashlib.sha1(key.encode()).hexdigest()+'.npz')
+
+def loadCache(path):
+    try:
+        with np.load(path) as f:
+            data = { k: f[k] for k in f.files }
+        os.utime(path)
+    except (IOError, OSError, ValueError):
+        return None
+    return data
+
+def storeCache(path, data):
+    try:
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        # np.savez appends .npz to names without it
+        with open(path+'.tmp', 'wb') as f:
+            np.savez(f, **data)
+        os.replace(path+'.tmp', path)
+        trimCache(keep=path)
+    except (IOError, OSError):
+        pass
+
+# remove least recently used entries until the cache fits in 'cacheSize'
+def trimCache(keep=None):
+    entries = []
+    for name in os.listdir(cacheDir):
+        if name.endswith('.npz'):
+            stat = os.stat(os.path.join(cacheDir, name))
+            entries.append((stat.st_mtime, stat.st_size, os.path.join(cacheDir, name)))
+    total = sum(e[1] for e in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= cacheSize:
+            break
+        if path != keep:
+            os.remove(path)
+            total -= size
+
+# passes cclib parsing progress on as a fraction of the file read
+class CclibProgress(object):
+    def __init__(self, progress):
+        self.progress = progress
+        self.nstep = 1
+
+    def initialize(self, nstep, text=None):
+        self.nstep = max(nstep, 1)
+
+    def update(self, step, text=None):
+        self.progress(float(step)/self.nstep, text or 'Parsing')
+
+# parse a Gaussian log with cclib, or load the result of an earlier parse
+# of the same unchanged file from the cache. A log still being written
+# keeps growing while cclib reads it, so only a snapshot of the complete
+# lines present when starting is parsed; 'offset' is its length in bytes,
+# where following the log with GaussianTail takes over
+def readGaussianLog(filename, progress=None):
+    stat = os.stat(filename)
+    path = cachePath(filename, stat)
+    data = loadCache(path)
+    if data is None or 'offset' not in data:
+        from cclib.parser import ccopen
+        with open(filename, 'rb') as f:
+            text = f.read(stat.st_size)
+        end = text.rfind(b'\n') + 1
+        snapshot = io.StringIO(text[:end].decode('latin-1'))
+        parser = ccopen(snapshot, progress=CclibProgress(progress)) if progress else ccopen(snapshot)
+        attrs = parser.parse().getattributes()
+        data = { k: np.asarray(attrs[k]) for k in cacheKeys if k in attrs }
+        data['offset'] = np.asarray(end)
+        storeCache(path, data)
+    return data
+
+# incremental parser for Gaussian logs that are still being written. Each
+# call to read() parses only the complete lines appended since the last
+# call and returns the new SCF energies (in eV, as cclib gives them),
+# convergence values and geometries. The geometry of a step is the last
+# orientation block printed before its SCF energy
+class GaussianTail(object):
+    geoItems = ['Maximum Force', 'RMS     Force', 'Maximum Displacement', 'RMS     Displacement']
+
+    def __init__(self, filename, offset=0):
+        self.filename = filename
+        self.offset = offset
+        self.block = None       # orientation block being read
+        self.dashes = 0
+        self.rows = []
+        self.coords = None      # last complete orientation
+        self.geo = {}           # convergence table being read
+
+    # returns None if the file got shorter since the last read, i.e. it
+    # was rewritten and has to be read again from the start
+    def read(self):
+        new = {'scfenergies': [], 'atomcoords': [], 'geovalues': [], 'geotargets': []}
+        with open(self.filename, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() < self.offset:
+                return None
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        self.offset += end
+        for line in data[:end].decode('latin-1').splitlines():
+            self.parseLine(line, new)
+        return new
+
+    def parseLine(self, line, new):
+        if self.block is not None:
+            if line.startswith(' ---'):
+                self.dashes += 1
+                if self.dashes == 3:
+                    self.coords = np.array(self.rows, dtype=float).reshape(-1, 3)
+                    self.block = None
+            elif self.dashes == 2:
+                self.rows.append(line.split()[3:6])
+        elif 'orientation:' in line and ('Standard' in line or 'Input' in line):
+            self.block = line.split()[0]
+            self.dashes = 0
+            self.rows = []
+        elif line.startswith(' SCF Done:'):
+            from cclib.parser.utils import convertor
+            energy = float(line.split('=')[1].split()[0])
+            new['scfenergies'].append(convertor(energy, 'hartree', 'eV'))
+            if self.coords is not None:
+                new['atomcoords'].append(self.coords)
+        else:
+            for i, item in enumerate(self.geoItems):
+                if line.startswith(' '+item):
+                    parts = line[len(item)+1:].split()
+                    self.geo[i] = [ toFloat(p) for p in parts[:2] ]
+                    if len(self.geo) == len(self.geoItems):
+                        new['geovalues'].append([ self.geo[j][0] for j in range(len(self.geoItems)) ])
+                        new['geotargets'].append([ self.geo[j][1] for j in range(len(self.geoItems)) ])
+                        self.geo = {}
+                    break
+
+# Gaussian prints '********' for values that do not fit their column
+def toFloat(s):
+    try:
+        return float(s)
+    except ValueError:
+        return np.nan
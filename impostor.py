@@ -0,0 +1,236 @@
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL import shaders
+from OpenGL.arrays import vbo
+from pyqtgraph.opengl.GLGraphicsItem import GLGraphicsItem
+
+# atoms and bonds of very large systems drawn as impostors: every atom is
+# one screen-aligned quad and every bond segment one quad along its axis,
+# and the fragment shaders ray-cast the exact sphere or cylinder inside the
+# quad, writing its depth so that they intersect correctly. That is 4
+# vertices per object however fine the view, instead of hundreds for
+# tessellated meshes. The shaders are GLSL 1.20 and read the fixed
+# function matrices that pyqtgraph sets up; the lighting is that of its
+# 'shaded' shader, so impostors look like the meshes they replace
+
+# per-object buffers: the positions, radius and colour of every atom and
+# the end points, radius and colour of every bond segment
+sphereDtype = np.dtype([('pos', np.float32, 3), ('radius', np.float32), ('color', np.float32, 4)])
+cylinderDtype = np.dtype([('ends', np.float32, (2, 3)), ('radius', np.float32), ('color', np.float32, 4)])
+
+lighting = """
+    vec4 shade(vec3 normal, vec4 color) {
+        float p = dot(normal, normalize(vec3(1.0, -1.0, -1.0)));
+        p = p < 0. ? 0. : p * 0.8;
+        return vec4(color.rgb * (0.2 + p), color.a);
+    }
+    float depth(vec3 hit) {
+        vec4 clip = gl_ProjectionMatrix * vec4(hit, 1.0);
+        return 0.5 + 0.5*clip.z/clip.w;
+    }
+"""
+
+# the quads are made larger than the silhouettes of the objects so that
+# the perspective outline of near objects still fits
+sphereVertex = """
+    #version 120
+    attribute vec3 pos;
+    attribute float radius;
+    attribute vec4 color;
+    attribute vec2 corner;
+    varying vec3 center;
+    varying float r;
+    varying vec4 c;
+    varying vec3 point;
+    void main() {
+        center = (gl_ModelViewMatrix * vec4(pos, 1.0)).xyz;
+        r = radius;
+        c = color;
+        point = center + vec3(1.5*radius*corner, 0.0);
+        gl_Position = gl_ProjectionMatrix * vec4(point, 1.0);
+    }
+"""
+
+sphereFragment = """
+    #version 120
+    varying vec3 center;
+    varying float r;
+    varying vec4 c;
+    varying vec3 point;
+""" + lighting + """
+    void main() {
+        // the eye is at the origin of view space
+        vec3 ray = normalize(point);
+        float b = dot(ray, center);
+        float h = b*b - dot(center, center) + r*r;
+        if (h < 0.0)
+            discard;
+        vec3 hit = ray*(b - sqrt(h));
+        gl_FragDepth = depth(hit);
+        gl_FragColor = shade((hit - center)/r, c);
+    }
+"""
+
+cylinderVertex = """
+    #version 120
+    attribute vec3 start;
+    attribute vec3 end;
+    attribute float radius;
+    attribute vec4 color;
+    attribute vec2 corner;
+    varying vec3 a;
+    varying vec3 b;
+    varying float r;
+    varying vec4 c;
+    varying vec3 point;
+    void main() {
+        a = (gl_ModelViewMatrix * vec4(start, 1.0)).xyz;
+        b = (gl_ModelViewMatrix * vec4(end, 1.0)).xyz;
+        r = radius;
+        c = color;
+        vec3 axis = normalize(b - a);
+        vec3 along = mix(a, b, corner.x);
+        vec3 side = cross(axis, along);
+        // looking straight down the axis any perpendicular will do
+        side = length(side) > 1e-6 ? normalize(side) : normalize(cross(axis, vec3(0.0, 1.0, 0.1)));
+        point = along + 1.5*radius*(corner.y*side + (2.0*corner.x - 1.0)*axis);
+        gl_Position = gl_ProjectionMatrix * vec4(point, 1.0);
+    }
+"""
+
+cylinderFragment = """
+    #version 120
+    varying vec3 a;
+    varying vec3 b;
+    varying float r;
+    varying vec4 c;
+    varying vec3 point;
+""" + lighting + """
+    void main() {
+        // ray against the open cylinder from a to b; the ends are covered
+        // by the atoms
+        vec3 ray = normalize(point);
+        vec3 ba = b - a;
+        vec3 oa = -a;
+        float baba = dot(ba, ba);
+        float bard = dot(ba, ray);
+        float baoa = dot(ba, oa);
+        float k2 = baba - bard*bard;
+        float k1 = baba*dot(oa, ray) - baoa*bard;
+        float k0 = baba*dot(oa, oa) - baoa*baoa - r*r*baba;
+        float h = k1*k1 - k2*k0;
+        if (h < 0.0 || k2 <= 0.0)
+            discard;
+        float t = (-k1 - sqrt(h))/k2;
+        float y = baoa + t*bard;
+        if (y < 0.0 || y > baba)
+            discard;
+        vec3 hit = ray*t;
+        gl_FragDepth = depth(hit);
+        gl_FragColor = shade((hit - a - ba*y/baba)/r, c);
+    }
+"""
+
+# GL item drawing the objects of a per-object buffer 'data' as quads. The
+# buffer is expanded to the four corners of every object; after writing
+# into 'data', call dataChanged() with the fields written, which are
+# expanded again and uploaded with the next frame
+class ImpostorItem(GLGraphicsItem):
+    def __init__(self, data):
+        GLGraphicsItem.__init__(self)
+        self.setGLOptions('opaque')
+        self.data = data
+        self.vertexDtype = np.dtype(self.data.dtype.descr + [('corner', np.float32, 2)])
+        self.program = None
+        self.verts = self.vertices()
+        self.buffer = None
+        self.changed = set()
+
+    def dataChanged(self, *names):
+        self.changed.update(names or self.data.dtype.names)
+        self.update()
+
+    def vertexCount(self):
+        return 4*len(self.data)
+
+    def vertices(self):
+        verts = np.empty(4*len(self.data), dtype=self.vertexDtype)
+        for name in self.data.dtype.names:
+            verts[name] = np.repeat(self.data[name], 4, axis=0)
+        verts['corner'] = np.tile(self.corners, (len(self.data), 1))
+        return verts
+
+    # the attributes of the shaders with their sizes and byte offsets in a
+    # vertex; the first is bound to location 0, as some drivers only draw
+    # when generic attribute 0 is an enabled array
+    def attributes(self):
+        attrs = []
+        for name in self.vertexDtype.names:
+            dtype, offset = self.vertexDtype.fields[name][:2]
+            if name == 'ends':
+                attrs += [('start', 3, offset), ('end', 3, offset+12)]
+            else:
+                attrs.append((name, max(dtype.shape[-1:] or (1,)), offset))
+        return attrs
+
+    def compile(self):
+        # #version has to come first in the source
+        program = shaders.compileProgram(shaders.compileShader(self.vertexShader.strip(), GL_VERTEX_SHADER), shaders.compileShader(self.fragmentShader.strip(), GL_FRAGMENT_SHADER))
+        glBindAttribLocation(program, 0, self.attributes()[0][0])
+        glLinkProgram(program)
+        return program
+
+    def paint(self):
+        if len(self.data) == 0:
+            return
+        self.setupGLState()
+        if self.program is None:
+            self.program = self.compile()
+        if self.changed:
+            for name in self.changed:
+                self.verts[name] = np.repeat(self.data[name], 4, axis=0)
+            self.changed.clear()
+            if self.buffer is not None:
+                self.buffer.set_array(self.verts)
+        if self.buffer is None:
+            self.buffer = vbo.VBO(self.verts)
+        glUseProgram(self.program)
+        self.buffer.bind()
+        locations = []
+        try:
+            for name, size, offset in self.attributes():
+                loc = glGetAttribLocation(self.program, name)
+                if loc < 0:
+                    continue
+                locations.append(loc)
+                glEnableVertexAttribArray(loc)
+                glVertexAttribPointer(loc, size, GL_FLOAT, GL_FALSE, self.vertexDtype.itemsize, self.buffer + offset)
+            glDrawArrays(GL_QUADS, 0, self.vertexCount())
+        finally:
+            for loc in locations:
+                glDisableVertexAttribArray(loc)
+            self.buffer.unbind()
+            glUseProgram(0)
+
+class SphereImpostors(ImpostorItem):
+    vertexShader = sphereVertex
+    fragmentShader = sphereFragment
+    corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]], dtype=np.float32)
+    def __init__(self, pos, radii, colors):
+        data = np.zeros(len(pos), dtype=sphereDtype)
+        data['pos'] = pos
+        data['radius'] = radii
+        data['color'] = colors
+        ImpostorItem.__init__(self, data)
+
+class CylinderImpostors(ImpostorItem):
+    vertexShader = cylinderVertex
+    fragmentShader = cylinderFragment
+    corners = np.array([[0, -1], [1, -1], [1, 1], [0, 1]], dtype=np.float32)
+    def __init__(self, starts, ends, colors, radius=.1):
+        data = np.zeros(len(starts), dtype=cylinderDtype)
+        data['ends'][:, 0] = starts
+        data['ends'][:, 1] = ends
+        data['radius'] = radius
+        data['color'] = colors
+        ImpostorItem.__init__(self, data)
@@ -1,24 +1,48 @@
 # coding=utf-8
 import pdb
-from scipy.stats import gmean
 from periodictable import elements
 import widgets
-import itertools
+import profiling
+import os
 import sys
 from os.path import expanduser
 from PyQt4.QtCore import *
-from PyQt4.Qt import QApplication, QWidget, QTableView, QStandardItem, QStandardItemModel, QColor, QFileDialog, QHBoxLayout, QVBoxLayout, QStatusBar, QAction, qApp, QMessageBox, QIcon, QMenuBar, QMenu
+from PyQt4.Qt import QApplication, QWidget, QTableView, QStandardItem, QStandardItemModel, QFileDialog, QHBoxLayout, QVBoxLayout, QStatusBar, QAction, qApp, QMessageBox, QIcon, QMenuBar, QMenu, QSlider, QActionGroup, QInputDialog
 from pyqtgraph import GraphicsLayoutWidget, mkPen, ErrorBarItem
 import pyqtgraph.opengl as gl
-from zmat import ZMError
+from math import degrees
 from utils import *
-from cclib.parser import ccopen
+from trajectory import XYZTrajectory
+from gaussian import readGaussianLog, GaussianTail
 
 #debugging
 #pdb.set_trace()
 
-# create Qt application
-qt_app = QApplication(sys.argv)
+# file readers run by widgets.FileLoader in a worker thread; they must not
+# touch any widgets and hand their results back as a dict
+def loadZmat(filename, progress):
+    return {'filename': filename, 'inp': readZmatFile(filename)}
+
+def loadXYZ(filename, progress):
+    trajectory = XYZTrajectory(filename, progress)
+    inp = []
+    try:
+        if len(trajectory):
+            elems, xyz = trajectory[0]
+            inp = xyz2zmat(xyz, elems, progress)
+    except:
+        trajectory.close()
+        raise
+    return {'filename': filename, 'trajectory': trajectory, 'inp': inp}
+
+def loadGaussian(filename, progress):
+    data = readGaussianLog(filename, progress)
+    atomsymbols = [ str(elements[e]) for e in data['atomnos'] ]
+    data['inp'] = xyz2zmat(data['atomcoords'][0], atomsymbols, progress)
+    data['filename'] = filename
+    # following the log continues after the part parsed here
+    data['offset'] = int(data['offset'])
+    return data
 
 # create main widget
 class MainWidget(QWidget):
@@ -35,19 +59,44 @@ class MainWidget(QWidget):
         ['O', 2, 1.4, 1, 105.],
         ['H', 3, 0.9, 2, 105., 1, 120.]]
 
-        self.atomList = []
         self.highList = []
         self.labelList = []
         self.fast = False
+        self.shift = None
+        self.trajectory = None
+        self.loader = None
+
+        # spectrum line shape, full width at half maximum and grid spacing,
+        # all in cm-1
+        self.spectrumShape = 'Lorentzian'
+        self.spectrumFWHM = 4*np.pi
+        self.spectrumResolution = 1.
+        self.irPlot = None
+        self.ramanPlot = None
+        self.experiment = None
+
+        # vibration animation of the selected frequency; the phase follows
+        # the elapsed time so dropped frames don't slow the vibration down
+        self.vibPeriod = 3000
+        self.vibAmplitude = 1/3.
+        self.framesKey = None
+        self.framesBase = None
+        self.frames = None
+        self.vibClock = QElapsedTimer()
+        self.timer = QTimer(self)
+        self.timer.setInterval(16)
+        self.timer.timeout.connect(self.updateFreq)
 
         # define & initialize ZMatModel that will contain Zmatrix data
-        self.ZMatModel = QStandardItemModel(len(self.inp), 7, self)
+        self.ZMatModel = widgets.ZMatModel(self)
+        # edits of the ZMatModel are redrawn through 'redraw', which draws
+        # all changes made within a few ms, or in a bulk() block, at once
+        self.redraw = widgets.RedrawScheduler(self.clearUpdateView, 10, self)
         self.ZMatTable = QTableView(self)
         self.ZMatTable.setModel(self.ZMatModel)
         self.ZMatTable.setFixedWidth(325)
         #self.ZMatTable.installEventFilter(self)
         #self.ZMatModel.installEventFilter(self)
-        self.ZMatModel.setHorizontalHeaderLabels(['atom','','bond','','angle','','dihedral'])
         for j, width in enumerate([40, 22, 65, 22, 65, 22, 65]):
             self.ZMatTable.setColumnWidth(j, width)
         # populate the ZMatModel
@@ -79,6 +128,20 @@ class MainWidget(QWidget):
         readGaussianAction.triggered.connect(self.readGaussian)
         fileMenu.addAction(readGaussianAction)
 
+        self.followAction = QAction('&Follow Gaussian log', self)
+        self.followAction.setCheckable(True)
+        self.followAction.setEnabled(False)
+        self.followAction.setStatusTip('Update the plots and geometry while the Gaussian log is being written')
+        self.followAction.toggled.connect(self.watchLog)
+        fileMenu.addAction(self.followAction)
+
+        self.cancelLoadAction = QAction('&Cancel loading', self)
+        self.cancelLoadAction.setShortcut('Esc')
+        self.cancelLoadAction.setStatusTip('Stop reading the file being loaded')
+        self.cancelLoadAction.setEnabled(False)
+        self.cancelLoadAction.triggered.connect(self.cancelLoad)
+        fileMenu.addAction(self.cancelLoadAction)
+
         writeZmatAction = QAction('&Write &ZMat', self)
         writeZmatAction.setShortcut('Ctrl+S')
         writeZmatAction.setStatusTip('Write Zmat to file')
@@ -91,6 +154,26 @@ class MainWidget(QWidget):
         writeXYZAction.triggered.connect(self.writeXYZ)
         fileMenu.addAction(writeXYZAction)
 
+        exportSpectrumAction = QAction('&Export spectrum', self)
+        exportSpectrumAction.setStatusTip('Write the IR and Raman spectra to a CSV or NPY file')
+        exportSpectrumAction.triggered.connect(self.exportSpectrum)
+        fileMenu.addAction(exportSpectrumAction)
+
+        exportAnimationAction = QAction('Export a&nimation', self)
+        exportAnimationAction.setStatusTip('Render the animated vibration or the Gaussian optimization to a GIF or PNG files')
+        exportAnimationAction.triggered.connect(self.exportAnimation)
+        fileMenu.addAction(exportAnimationAction)
+
+        readExperimentAction = QAction('Read e&xperimental spectrum', self)
+        readExperimentAction.setStatusTip('Read a measured IR spectrum and compare it with the calculated one')
+        readExperimentAction.triggered.connect(self.readExperiment)
+        fileMenu.addAction(readExperimentAction)
+
+        saveTraceAction = QAction('Save profile &trace', self)
+        saveTraceAction.setStatusTip('Write the recorded drawing timings as a Chrome trace')
+        saveTraceAction.triggered.connect(self.saveTrace)
+        fileMenu.addAction(saveTraceAction)
+
         exitAction = QAction('&Exit', self)
         exitAction.setShortcut('Ctrl+Q')
         exitAction.setStatusTip('Exit application')
@@ -117,10 +200,14 @@ class MainWidget(QWidget):
 
         drawModeMenu = QMenu('Draw mode', self)
         viewMenu.addMenu(drawModeMenu)
+        autoDrawAction = QAction('&Automatic detail', self)
+        autoDrawAction.setStatusTip('Adapt the detail of atoms and bonds to the molecule size, zoom and drawing speed')
+        autoDrawAction.triggered.connect(self.autoDraw)
         fastDrawAction = QAction('&Fast draw', self)
         fastDrawAction.triggered.connect(self.fastDraw)
         normalDrawAction = QAction('&Normal draw', self)
         normalDrawAction.triggered.connect(self.normalDraw)
+        drawModeMenu.addAction(autoDrawAction)
         drawModeMenu.addAction(normalDrawAction)
         drawModeMenu.addAction(fastDrawAction)
 
@@ -155,6 +242,33 @@ class MainWidget(QWidget):
         self.showFreqAction.triggered.connect(self.showFreq)
         viewMenu.addAction(self.showFreqAction)
 
+        spectrumMenu = QMenu('&Spectrum', self)
+        viewMenu.addMenu(spectrumMenu)
+        shapeGroup = QActionGroup(self)
+        for shape in sorted(lineShapes, reverse=True):
+            shapeAction = QAction(shape, shapeGroup)
+            shapeAction.setCheckable(True)
+            shapeAction.setChecked(shape == self.spectrumShape)
+            shapeAction.setStatusTip('Broaden spectrum lines with '+shape+' line shapes')
+            shapeAction.triggered.connect(lambda checked, shape=shape: self.setSpectrumShape(shape))
+            spectrumMenu.addAction(shapeAction)
+        spectrumMenu.addSeparator()
+        spectrumWidthAction = QAction('Line &width...', self)
+        spectrumWidthAction.setStatusTip('Set the full width at half maximum of spectrum lines')
+        spectrumWidthAction.triggered.connect(self.setSpectrumWidth)
+        spectrumMenu.addAction(spectrumWidthAction)
+        spectrumResolutionAction = QAction('&Resolution...', self)
+        spectrumResolutionAction.setStatusTip('Set the spacing of spectrum points')
+        spectrumResolutionAction.triggered.connect(self.setSpectrumResolution)
+        spectrumMenu.addAction(spectrumResolutionAction)
+
+        profileAction = QAction('&Profile drawing', self)
+        profileAction.setCheckable(True)
+        profileAction.setChecked(profiling.enabled)
+        profileAction.setStatusTip('Time the drawing stages and show the timings over the molecule')
+        profileAction.toggled.connect(self.setProfiling)
+        viewMenu.addAction(profileAction)
+
         measureDistanceAction = QAction('&Measure &distance', self)
         measureDistanceAction.setShortcut('Ctrl+D')
         measureDistanceAction.setStatusTip('Measure distance between two atoms')
@@ -180,7 +294,10 @@ class MainWidget(QWidget):
         # define GL widget that displays the 3D molecule model
         self.window = widgets.MyGLView()
         self.window.installEventFilter(self)
+        self.window.vibrationStopped.connect(self.stopFreq)
         self.window.setMinimumSize(500, 500)
+        # tessellation follows the molecule size and zoom unless picked by hand
+        self.window.setAutoDetail(True)
         #self.window.setBackgroundColor((50, 0, 10))
         self.updateView()
 
@@ -211,6 +328,29 @@ class MainWidget(QWidget):
         self.freqWidget.layout.addWidget(self.freqTable)
         self.freqTable.clicked.connect(self.freqCellClicked)
 
+        # slider for scrubbing through the frames of XYZ trajectories
+        self.frameSlider = QSlider(Qt.Horizontal, self)
+        self.frameSlider.valueChanged.connect(self.xyzFrameChanged)
+        # only the last frame the slider passed within a redraw interval is
+        # read and converted
+        self.xyzFrame = 0
+        self.frameRedraw = widgets.RedrawScheduler(self.showXYZFrame, 10, self)
+        self.frameSlider.hide()
+
+        # playback of the geometries of Gaussian optimizations
+        self.playFrames = None
+        self.playSubsteps = 1
+        self.playback = widgets.PlaybackBar(self)
+        self.playback.frameChanged.connect(self.playbackFrame)
+        self.playback.settled.connect(self.playbackSettled)
+        self.playback.smoothingChanged.connect(lambda substeps: self.buildPlayback())
+        self.playback.hide()
+
+        # watches the Gaussian log that is being followed
+        self.logTail = None
+        self.logWatcher = QFileSystemWatcher(self)
+        self.logWatcher.fileChanged.connect(self.followLog)
+
         # define other application parts
         self.statusBar = QStatusBar(self)
         self.fileDialog = QFileDialog(self)
@@ -225,11 +365,13 @@ class MainWidget(QWidget):
         self.layout1.addWidget(self.window)
         self.layout.addWidget(self.menuBar)
         self.layout.addLayout(self.layout1)
+        self.layout.addWidget(self.frameSlider)
+        self.layout.addWidget(self.playback)
         self.layout.addWidget(self.statusBar)
 
         self.adjustSize()
         self.setWindowTitle('Moldy')
-        iconPath = 'icon.png'
+        iconPath = resourcePath('icon.png')
         icon = QIcon(iconPath)
         icon.addFile(iconPath, QSize(16, 16))
         icon.addFile(iconPath, QSize(24, 24))
@@ -239,28 +381,18 @@ class MainWidget(QWidget):
         self.setWindowIcon(icon)
 
         # start monitoring changes in the ZMatModel
-        self.ZMatModel.dataChanged.connect(self.clearUpdateView)
+        self.ZMatModel.dataChanged.connect(self.redraw.schedule)
 
     # run and show the application
     def run(self):
         self.show()
         self.ZMatTable.clicked.connect(self.ZMatCellClicked)
-        qt_app.instance().aboutToQuit.connect(self.deleteGLwidget)
-        qt_app.exec_()
+        QApplication.instance().aboutToQuit.connect(self.deleteGLwidget)
+        QApplication.instance().exec_()
 
     # fill the ZMatModel with initial data from 'self.inp'
     def populateZMatModel(self):
-        self.ZMatModel.removeRows(0, self.ZMatModel.rowCount())
-        for i, row in enumerate(self.inp):
-            for j, cell in enumerate(row):
-                item = QStandardItem(str(cell))
-                self.ZMatModel.setItem(i, j, item)
-        # some cells should not be editable, they are disabled
-        for i in range(min(len(self.inp), 3)):
-            for j in range(2*i+1, 7):
-                self.ZMatModel.setItem(i, j, QStandardItem())
-                self.ZMatModel.item(i, j).setBackground(QColor(150,150,150))
-                self.ZMatModel.item(i, j).setFlags(Qt.ItemIsEnabled)
+        self.ZMatModel.setZmat(self.inp)
     
     def populateFreqModel(self):
         self.FreqModel.removeRows(0, self.FreqModel.rowCount())
@@ -271,18 +403,7 @@ class MainWidget(QWidget):
 
     # add a row to the bottom of the ZMatModel
     def addRow(self):
-        # temporarily stop updating the GL window
-        self.ZMatModel.dataChanged.disconnect(self.clearUpdateView)
-        row = self.ZMatModel.rowCount()
-        self.ZMatModel.insertRow(row)
-        # some cells should not be editable
-        if row < 3:
-            for j in range(2*row+1, 7):
-                self.ZMatModel.setItem(row, j, QStandardItem())
-                self.ZMatModel.item(row, j).setBackground(QColor(150,150,150))
-                self.ZMatModel.item(row, j).setFlags(Qt.ItemIsEnabled)
-        # restart GL window updating
-        self.ZMatModel.dataChanged.connect(self.clearUpdateView)
+        self.ZMatModel.insertRow(self.ZMatModel.rowCount())
         self.statusBar.clearMessage()
         self.statusBar.showMessage('Added 1 row.', 3000)
 
@@ -296,24 +417,17 @@ class MainWidget(QWidget):
         if newLen == oldLen:
             self.ZMatModel.removeRow(self.ZMatModel.rowCount()-1)
         else:
-            self.ZMatModel.dataChanged.disconnect(self.clearUpdateView)
-            for idx in idxs:
-                self.ZMatModel.removeRow(idx)
-                if idx < 3:
-                    for i in range(idx, min(3, newLen)):
-                        for j in range(2*i+1, 7):
-                            self.ZMatModel.setItem(i, j, QStandardItem())
-                            self.ZMatModel.item(i, j).setBackground(QColor(150,150,150))
-                            self.ZMatModel.item(i, j).setFlags(Qt.ItemIsEnabled)
-                if len(xyz) > idx:
-                    xyz.pop(idx)
-                    atoms.pop(idx)
-            self.inp = xyz2zmat(xyz, atoms)
-            self.populateZMatModel()
+            with self.redraw.bulk():
+                for idx in idxs:
+                    self.ZMatModel.removeRow(idx)
+                    if len(xyz) > idx:
+                        xyz.pop(idx)
+                        atoms.pop(idx)
+                self.inp = xyz2zmat(xyz, atoms)
+                self.populateZMatModel()
             for i in reversed(self.highList):
                 self.window.removeItem(i[1])
             self.highList = []
-            self.ZMatModel.dataChanged.connect(self.clearUpdateView)
         self.updateView()
         self.statusBar.clearMessage()
         if idxs:
@@ -329,147 +443,363 @@ class MainWidget(QWidget):
         selection = self.periodicTableWidget.selection()
         return selection
 
+    # read files in a worker thread; 'loaded' is called with the result of
+    # 'func' in the GUI thread. A load still running is cancelled first
+    def startLoader(self, func, filename, loaded):
+        self.cancelLoad()
+        self.loader = widgets.FileLoader(func, filename, self)
+        self.loader.progress.connect(self.loadProgress)
+        self.loader.loaded.connect(loaded)
+        self.loader.failed.connect(self.loadFailed)
+        self.loader.finished.connect(self.loadFinished)
+        self.cancelLoadAction.setEnabled(True)
+        self.statusBar.clearMessage()
+        self.statusBar.showMessage('Reading '+filename+'...')
+        self.loader.start()
+
+    def cancelLoad(self):
+        if self.loader is not None:
+            try:
+                self.loader.loaded.disconnect()
+            except TypeError:
+                pass
+            self.loader.cancel()
+
+    def loadProgress(self, percent, text):
+        self.statusBar.showMessage(text+': '+str(percent)+'%')
+
+    def loadFailed(self, message):
+        self.statusBar.clearMessage()
+        self.statusBar.showMessage(message, 5000)
+
+    def loadFinished(self):
+        if self.sender() is self.loader:
+            self.loader = None
+            self.cancelLoadAction.setEnabled(False)
+        self.sender().deleteLater()
+
     # import molecule with zmatrix coordinates
     def readZmat(self):
-        self.ZMatModel.dataChanged.disconnect(self.clearUpdateView)
         filename = self.fileDialog.getOpenFileName(self, 'Open file', expanduser('~'), '*.zmat;;*.*')
-        self.inp = []
-        self.populateZMatModel()
         if filename:
-            with open(filename, 'r') as f:
-                next(f)
-                next(f)
-                for row in f:
-                    self.inp.append(row.split())
-                f.close()
+            self.startLoader(loadZmat, filename, self.zmatLoaded)
+
+    def zmatLoaded(self, result):
+        self.stopFreq()
+        self.closeTrajectory()
+        self.closeLog()
+        self.inp = result['inp']
+        with self.redraw.bulk():
             self.populateZMatModel()
-        self.ZMatModel.dataChanged.connect(self.clearUpdateView)
         self.updateView()
         self.statusBar.clearMessage()
-        self.statusBar.showMessage('Read molecule from '+filename+'.', 5000)
+        self.statusBar.showMessage('Read molecule from '+result['filename']+'.', 5000)
         self.showGaussAction.setEnabled(False)
         self.showFreqAction.setEnabled(False)
 
-    # import molecule with xyz coordinates
+    # import molecule with xyz coordinates; files with more than one frame
+    # are kept open and can be scrubbed through with the frame slider
     def readXYZ(self):
-        self.ZMatModel.dataChanged.disconnect(self.clearUpdateView)
         filename = self.fileDialog.getOpenFileName(self, 'Open file', expanduser('~'), '*.xyz;;*.*')
-        xyz = []
-        elems = []
-        self.inp = []
-        self.populateZMatModel()
         if filename:
-            with open(filename, 'r') as f:
-                next(f)
-                next(f)
-                for row in f:
-                    rs = row.split()
-                    if len(rs) == 4:
-                        elems.append(rs[0])
-                        xyz.append([float(f) for f in rs[1:]])
-                f.close()
-            self.inp = xyz2zmat(xyz, elems)
+            self.startLoader(loadXYZ, filename, self.xyzLoaded)
+
+    def xyzLoaded(self, result):
+        self.stopFreq()
+        self.closeTrajectory()
+        self.closeLog()
+        self.trajectory = result['trajectory']
+        self.inp = result['inp']
+        with self.redraw.bulk():
             self.populateZMatModel()
-            #print(elems)
-        self.ZMatModel.dataChanged.connect(self.clearUpdateView)
+        if len(self.trajectory) > 1:
+            self.frameSlider.blockSignals(True)
+            self.frameSlider.setRange(0, len(self.trajectory)-1)
+            self.frameSlider.setValue(0)
+            self.frameSlider.blockSignals(False)
+            self.frameSlider.show()
         self.updateView()
         self.statusBar.clearMessage()
-        self.statusBar.showMessage('Read molecule from '+filename+'.', 5000)
+        if len(self.trajectory) > 1:
+            self.statusBar.showMessage('Read '+str(len(self.trajectory))+' frames from '+result['filename']+'.', 5000)
+        else:
+            self.statusBar.showMessage('Read molecule from '+result['filename']+'.', 5000)
         self.showGaussAction.setEnabled(False)
         self.showFreqAction.setEnabled(False)
 
+    # show frame 'idx' of the open XYZ trajectory; while the slider is
+    # dragged the frames are read and drawn once per redraw interval
+    def xyzFrameChanged(self, idx):
+        self.xyzFrame = idx
+        self.frameRedraw.schedule()
+        self.statusBar.clearMessage()
+        self.statusBar.showMessage('Frame '+str(idx+1)+' of '+str(len(self.trajectory))+'.', 3000)
+
+    def showXYZFrame(self):
+        if self.trajectory is None:
+            return
+        elems, xyz = self.trajectory[self.xyzFrame]
+        self.inp = xyz2zmat(xyz, elems)
+        with self.redraw.bulk():
+            self.populateZMatModel()
+        self.clearUpdateView()
+
+    def closeTrajectory(self):
+        self.frameRedraw.cancel()
+        self.frameSlider.hide()
+        if self.trajectory is not None:
+            self.trajectory.close()
+            self.trajectory = None
+
     # import Gaussian log file
     def readGaussian(self):
-        global vsShifted
-        self.ZMatModel.dataChanged.disconnect(self.clearUpdateView)
         filename = self.fileDialog.getOpenFileName(self, 'Open file', expanduser('~'), '*.log;;*.*')
         if filename:
-            self.gaussianPlot.clear()
-            self.inp = []
-            self.populateZMatModel()
-            file = ccopen(filename)
-            data = file.parse().getattributes()
-            self.natom = data['natom']
-            self.atomnos = data['atomnos'].tolist()
-            self.atomsymbols = [ str(elements[e]) for e in self.atomnos ]
-            self.atomcoords = data['atomcoords'].tolist()
-            self.scfenergies = data['scfenergies'].tolist()
-            self.geovalues = data['geovalues'].T.tolist()
-            self.geotargets = data['geotargets'].tolist()
-            if 'vibfreqs' in data.keys():
-                self.vibfreqs = data['vibfreqs']
-                #print(self.vibfreqs)
-                self.vibirs = data['vibirs']
-                #print(self.vibirs)
-                #print(data.keys())
-                if 'vibramans' in data.keys():
-                    self.vibramans = data['vibramans']
-                else:
-                    self.vibramans = [''] * len(self.vibirs)
-                self.vibdisps = data['vibdisps']
-                #print(self.vibdisps)
-            self.inp = xyz2zmat(self.atomcoords[0], self.atomsymbols)
+            self.startLoader(loadGaussian, filename, self.gaussianLoaded)
+
+    def gaussianLoaded(self, data):
+        self.stopFreq()
+        self.framesKey = None
+        filename = data['filename']
+        self.closeTrajectory()
+        self.gaussianPlot.clear()
+        self.natom = data['natom']
+        self.atomnos = data['atomnos'].tolist()
+        self.atomsymbols = [ str(elements[e]) for e in self.atomnos ]
+        self.atomcoords = data['atomcoords'].tolist()
+        self.scfenergies = data['scfenergies'].tolist()
+        self.geovalues = data['geovalues'].T.tolist()
+        self.geotargets = data['geotargets'].tolist()
+        if 'vibfreqs' in data.keys():
+            self.vibfreqs = data['vibfreqs']
+            #print(self.vibfreqs)
+            self.vibirs = data['vibirs']
+            #print(self.vibirs)
+            #print(data.keys())
+            if 'vibramans' in data.keys():
+                self.vibramans = data['vibramans']
+            else:
+                self.vibramans = [''] * len(self.vibirs)
+            self.vibdisps = data['vibdisps']
+            #print(self.vibdisps)
+        self.inp = data['inp']
+        with self.redraw.bulk():
             self.populateZMatModel()
 
-            titles = ['SCF Energies', 'RMS & Max Forces', 'RMS & Max Displacements']
-            for i in range(3):
-                self.gaussianPlot.addPlot(row=1, col=i+1)
-                plot = self.gaussianPlot.getItem(1, i+1)
-                plot.setTitle(title=titles[i])
-                if i == 0:
-                    c = ['c']
-                    x = [0]
-                    y = [self.scfenergies]
-                else:
-                    c = ['r', 'y']
-                    x = [0, 0]
-                    y = [self.geovalues[2*i-2], self.geovalues[2*i-1]]
-                    targety = [self.geotargets[2*i-2], self.geotargets[2*i-1]]
-                plot.clear()
-                plot.maxData = plot.plot(y[0], symbol='o', symbolPen=c[0], symbolBrush=c[0], pen=c[0], symbolSize=5, pxMode=True, antialias=True, autoDownsample=False)
-                plot.highlight=plot.plot(x, [ yy[0] for yy in y ], symbol='o', symbolPen='w', symbolBrush=None, pen=None, symbolSize=15, pxMode=True, antialias=True, autoDownsample=False)
-                plot.maxData.sigPointsClicked.connect(self.gausclicked)
-                if i > 0:
-                    for j in range(2):
-                        plot.addLine(y=np.log10(targety[j]), pen=mkPen((255, 255*j, 0, int(255/2)), width=1))
-                    plot.RMSData=plot.plot(y[1], symbol='o', symbolPen=c[1], symbolBrush=c[1], pen=c[1], symbolSize=5, pxMode=True, antialias=True, autoDownsample=False)
-                    plot.RMSData.sigPointsClicked.connect(self.gausclicked)
-                    plot.setLogMode(y=True)
-            self.showGauss()
-            self.updateView()
+        titles = ['SCF Energies', 'RMS & Max Forces', 'RMS & Max Displacements']
+        for i in range(3):
+            self.gaussianPlot.addPlot(row=1, col=i+1)
+            plot = self.gaussianPlot.getItem(1, i+1)
+            plot.setTitle(title=titles[i])
+            if i == 0:
+                c = ['c']
+                x = [0]
+                y = [self.scfenergies]
+            else:
+                c = ['r', 'y']
+                x = [0, 0]
+                y = [self.geovalues[2*i-2], self.geovalues[2*i-1]]
+                targety = [self.geotargets[2*i-2], self.geotargets[2*i-1]]
+            plot.clear()
+            plot.maxData = plot.plot(y[0], symbol='o', symbolPen=c[0], symbolBrush=c[0], pen=c[0], symbolSize=5, pxMode=True, antialias=True, autoDownsample=False)
+            plot.highlight=plot.plot(x, [ yy[0] for yy in y ], symbol='o', symbolPen='w', symbolBrush=None, pen=None, symbolSize=15, pxMode=True, antialias=True, autoDownsample=False)
+            plot.maxData.sigPointsClicked.connect(self.gausclicked)
+            if i > 0:
+                for j in range(2):
+                    plot.addLine(y=np.log10(targety[j]), pen=mkPen((255, 255*j, 0, int(255/2)), width=1))
+                plot.RMSData=plot.plot(y[1], symbol='o', symbolPen=c[1], symbolBrush=c[1], pen=c[1], symbolSize=5, pxMode=True, antialias=True, autoDownsample=False)
+                plot.RMSData.sigPointsClicked.connect(self.gausclicked)
+                plot.setLogMode(y=True)
+        self.showGauss()
+        self.updateView()
+        self.playFrames = None
+        self.buildPlayback(0)
+        self.statusBar.clearMessage()
+        self.statusBar.showMessage('Read molecule from '+filename+'.', 5000)
+        if self.natom:
+            self.showGaussAction.setEnabled(True)
+        self.logTail = GaussianTail(filename, data['offset'])
+        self.followAction.setEnabled(True)
+        self.watchLog()
+        if 'vibfreqs' in data.keys():
+            self.showFreqAction.setEnabled(True)
+
+            # populate the FreqModel
+            self.populateFreqModel()
+
+            self.freqPlot.clear()
+            self.irPlot = self.freqPlot.addPlot(row=1, col=1, title='IR')
+            self.irPlot.maxData = self.irPlot.plot(antialias=True)
+            self.irPlot.expData = self.irPlot.plot(pen='g', antialias=True)
+            markers = ErrorBarItem(x=self.vibfreqs, y=self.vibirs, top=np.max(self.vibirs)/30, bottom=None, pen='r')
+            self.irPlot.addItem(markers)
+            self.ramanPlot = None
+            if 'vibramans' in data.keys():
+                self.ramanPlot = self.freqPlot.addPlot(row=2, col=1, title='Raman')
+                self.ramanPlot.setXLink(self.irPlot)
+                self.ramanPlot.maxData = self.ramanPlot.plot(antialias=True)
+                markers = ErrorBarItem(x=self.vibfreqs, y=self.vibramans, top=np.max(self.vibramans)/30, bottom=None, pen='r')
+                self.ramanPlot.addItem(markers)
+            self.drawSpectra()
+            self.showFreq()
+        else:
+            self.irPlot = None
+            self.ramanPlot = None
+            self.showFreqAction.setEnabled(False)
+            self.freqWidget.hide()
+
+    # broaden the IR and Raman lines with the current spectrum settings
+    def drawSpectra(self):
+        if self.irPlot is None:
+            return
+        x = spectrumGrid(self.vibfreqs, self.spectrumResolution)
+        for plot, intensities in [(self.irPlot, self.vibirs), (self.ramanPlot, self.vibramans)]:
+            if plot is not None:
+                plot.maxData.setData(x, spectrum(x, self.vibfreqs, intensities, self.spectrumFWHM, self.spectrumShape))
+        if self.experiment is not None:
+            # the measurement is scaled to the height of the calculated
+            # spectrum, which is also evaluated on the measured grid for scoring
+            ex, ey, name = self.experiment
+            y = spectrum(ex, self.vibfreqs, self.vibirs, self.spectrumFWHM, self.spectrumShape)
+            self.irPlot.expData.setData(ex, ey*(y.max()/ey.max() if ey.max() > 0 else 1))
+            overlap, cosine = compareSpectra(ex, ey, y)
+            self.statusBar.showMessage('%s: overlap %.3f, cosine similarity %.3f' % (name, overlap[0], cosine[0]))
+        else:
+            self.irPlot.expData.setData([], [])
+
+    # calculated spectra on the current grid
+    def exportSpectrum(self):
+        if self.irPlot is None:
+            self.statusBar.showMessage('No frequencies to export.', 5000)
+            return
+        filename = self.fileDialog.getSaveFileName(self, 'Save file', expanduser('~')+'/spectrum.csv', '*.csv;;*.npy')
+        if filename:
+            x = spectrumGrid(self.vibfreqs, self.spectrumResolution)
+            ys = [spectrum(x, self.vibfreqs, self.vibirs, self.spectrumFWHM, self.spectrumShape)]
+            names = ['ir']
+            if self.ramanPlot is not None:
+                ys.append(spectrum(x, self.vibfreqs, self.vibramans, self.spectrumFWHM, self.spectrumShape))
+                names.append('raman')
+            writeSpectrum(filename, x, ys, names)
             self.statusBar.clearMessage()
-            self.statusBar.showMessage('Read molecule from '+filename+'.', 5000)
-            self.ZMatModel.dataChanged.connect(self.clearUpdateView)
-            if self.natom:
-                self.showGaussAction.setEnabled(True)
-            if 'vibfreqs' in data.keys():
-                self.showFreqAction.setEnabled(True)
-
-                # populate the FreqModel
-                self.populateFreqModel()
-
-                self.freqPlot.clear()
-                irPlot = self.freqPlot.addPlot(row=1, col=1)
-                irPlot.clear()
-                minFreq = np.min(self.vibfreqs)
-                maxFreq = np.max(self.vibfreqs)
-                maxInt = np.max(self.vibirs)
-                x = np.sort(np.concatenate([np.linspace(minFreq-100, maxFreq+100, num=1000), self.vibfreqs]))
-                y = x*0
-                for f,i in zip(self.vibfreqs, self.vibirs):
-                    y += lorentzv(x, f, 2*np.pi, i)
-                #xy = np.array([np.concatenate([x, np.array(self.vibfreqs)]), np.concatenate([y, np.array(self.vibirs)])]).T
-                #xysort = xy[xy[:,0].argsort()]
-                irPlot.maxData = irPlot.plot(x, y, antialias=True)
-                markers = ErrorBarItem(x=self.vibfreqs, y=self.vibirs, top=maxInt/30, bottom=None, pen='r')
-                irPlot.addItem(markers)
-                self.showFreq()
-                #self.vibdisps = np.append(self.vibdisps, [np.mean(self.vibdisps, axis=0)], axis=0)
-                maxt = 100
-                vsShifted = np.array([ [ vs + self.vibdisps[i]*np.sin(t*2*np.pi/maxt)/3 for t in range(maxt) ] for i in range(len(self.vibfreqs)) ])
+            self.statusBar.showMessage('Wrote spectrum to '+filename+'.', 5000)
+
+    def readExperiment(self):
+        if self.irPlot is None:
+            self.statusBar.showMessage('Read a Gaussian frequency calculation first.', 5000)
+            return
+        filename = self.fileDialog.getOpenFileName(self, 'Open file', expanduser('~'), '*.csv *.txt *.dat;;*.npy;;*.*')
+        if filename:
+            try:
+                x, y = readSpectrum(filename)
+            except (IOError, OSError, ValueError) as e:
+                self.statusBar.showMessage('Could not read '+filename+': '+str(e), 5000)
+                return
+            if len(x) < 2:
+                self.statusBar.showMessage('No spectrum found in '+filename+'.', 5000)
+                return
+            self.experiment = x, y, filename
+            self.drawSpectra()
+
+    def setSpectrumShape(self, shape):
+        self.spectrumShape = shape
+        self.drawSpectra()
+
+    def setSpectrumWidth(self):
+        fwhm, ok = QInputDialog.getDouble(self, 'Line width', 'Full width at half maximum (cm-1):', self.spectrumFWHM, 0.01, 1000., 2)
+        if ok:
+            self.spectrumFWHM = fwhm
+            self.drawSpectra()
+
+    def setSpectrumResolution(self):
+        resolution, ok = QInputDialog.getDouble(self, 'Resolution', 'Spacing of spectrum points (cm-1):', self.spectrumResolution, 0.01, 100., 2)
+        if ok:
+            self.spectrumResolution = resolution
+            self.drawSpectra()
+
+    # (re)start watching the loaded Gaussian log if following is on
+    def watchLog(self):
+        files = self.logWatcher.files()
+        if files:
+            self.logWatcher.removePaths(files)
+        if self.followAction.isChecked() and self.logTail is not None:
+            self.logWatcher.addPath(self.logTail.filename)
+            self.followLog()
+
+    def closeLog(self):
+        self.playFrames = None
+        self.playback.setPlaying(False)
+        self.playback.hide()
+        self.logTail = None
+        self.followAction.setEnabled(False)
+        self.watchLog()
+
+    # parse what was appended to the followed log and extend the plots
+    def followLog(self):
+        if self.logTail is None or self.loader is not None:
+            return
+        try:
+            new = self.logTail.read()
+        except (IOError, OSError):
+            return
+        if new is None:
+            # the log was rewritten, e.g. by a restarted job
+            self.startLoader(loadGaussian, self.logTail.filename, self.gaussianLoaded)
+            return
+        self.atomcoords.extend(xyz.tolist() for xyz in new['atomcoords'])
+        self.scfenergies.extend(new['scfenergies'])
+        for values in new['geovalues']:
+            for k, v in enumerate(values):
+                self.geovalues[k].append(v)
+        if not new['scfenergies'] and not new['geovalues']:
+            return
+        for i in range(3):
+            plot = self.gaussianPlot.getItem(1, i+1)
+            if i == 0:
+                plot.maxData.setData(self.scfenergies)
             else:
-                self.showFreqAction.setEnabled(False)
-                self.freqWidget.hide()
+                plot.maxData.setData(self.geovalues[2*i-2])
+                plot.RMSData.setData(self.geovalues[2*i-1])
+        if new['atomcoords']:
+            self.gaussianStep(len(self.scfenergies)-1, incremental=True)
+            self.buildPlayback(len(self.atomcoords)-1)
+        self.statusBar.showMessage('Step '+str(len(self.scfenergies))+' of '+self.logTail.filename+'.', 3000)
+
+    # frames for playing the optimization back, aligned onto the shown
+    # geometry so that playback starts without a jump and interpolated with
+    # the smoothing of the playback bar; the playback is put at step 'step',
+    # or kept where it is
+    def buildPlayback(self, step=None):
+        if len(self.atomcoords) < 2 or len(self.atomcoords[0]) != len(vs):
+            self.playFrames = None
+            self.playback.hide()
+            return
+        if step is None:
+            step = self.playback.frame()//self.playSubsteps if self.playFrames is not None else 0
+        self.playSubsteps = self.playback.smoothBox.value()
+        self.playFrames = interpolateFrames(alignFrames(self.atomcoords, vs), self.playSubsteps)
+        self.playback.blockSignals(True)
+        self.playback.setFrameCount(len(self.playFrames))
+        self.playback.setFrame(step*self.playSubsteps)
+        self.playback.blockSignals(False)
+        self.playback.label.setText('step %d of %d' % (step+1, len(self.atomcoords)))
+        self.playback.show()
+
+    # show playback frame 'i' in the 3D view only; the Zmatrix follows when
+    # playback comes to rest (playbackSettled)
+    def playbackFrame(self, i):
+        frame = self.playFrames[i]
+        step = i//self.playSubsteps
+        self.window.removeOverlays()
+        self.window.setMolecule(frame, r, c, getBonds(frame, r), fast=self.fast)
+        self.highlightStep(min(step, len(self.scfenergies)-1))
+        self.playback.label.setText('step %d of %d' % (step+1, len(self.atomcoords)))
+
+    # once playback rests, the Zmatrix and everything working on the shown
+    # geometry are brought to the step of its frame
+    def playbackSettled(self, i):
+        if self.playFrames is not None:
+            self.gaussianStep(min(i//self.playSubsteps, len(self.atomcoords)-1), incremental=True)
 
     def showGauss(self):
         self.gaussianPlot.show()
@@ -479,7 +809,7 @@ class MainWidget(QWidget):
 
     # export Zmatrix to csv
     def writeZmat(self):
-        zm = model2list(self.ZMatModel)
+        zm = self.ZMatModel.toList()
         filename = self.fileDialog.getSaveFileName(self, 'Save file', expanduser('~')+'/'+getFormula(list(list(zip(*zm))[0]))+'.zmat', '*.zmat;;*.*')
         try:
             filename
@@ -494,7 +824,7 @@ class MainWidget(QWidget):
     # export XYZ coordinates to csv
     def writeXYZ(self):
         xyz = []
-        zm = model2list(self.ZMatModel)
+        zm = self.ZMatModel.toList()
         for i in range(len(v)):
             xyz.append(np.round(v[i], 7).tolist())
             xyz[i][:0] = zm[i][0]
@@ -513,30 +843,36 @@ class MainWidget(QWidget):
                 self.statusBar.clearMessage()
                 self.statusBar.showMessage('Wrote molecule to '+filename+'.', 5000)
 
-    # redraw the 3D molecule in GL widget
-    def updateView(self):
+    # redraw the 3D molecule in GL widget; in incremental mode the molecule
+    # keeps its centering shift and camera so that only edited atoms move
+    @profiling.timed('updateView')
+    def updateView(self, incremental=False):
         global r
         global c
         global v
         global vs
         global elems
         global nelems
-        data = model2list(self.ZMatModel)
+        # this draws everything in the ZMatModel, so redraws still waiting
+        # for edits made before are not needed
+        self.redraw.cancel()
+        zmat = self.ZMatModel.filled()
         try:
             # create a list with element coordinates
-            v = zmat2xyz(data)
+            with profiling.stage('zarray2xyz', atoms=len(zmat)):
+                v = zarray2xyz(zmat)
         except (AssertionError, IndexError, ZMError):
             pass
         else:
-            # clear the screen before redraw
-            for item in reversed(self.window.items):
-                self.window.removeItem(item)
+            # clear the screen before redraw; the molecule items are kept
+            # and only updated where atoms moved
+            self.window.removeOverlays()
             # create a second coordinate list 'vs' that is centered in the GL view
-            self.atomList = []
             if len(v) > 0:
-                shift = np.mean(v, axis=0)
-                vs = np.add(v, -shift)
-                elems = [ 1 + next((i for i, sublist in enumerate(colors) if row[0] in sublist), -1) for row in data ]
+                if not incremental or self.shift is None or len(v) != len(self.window.atomPos):
+                    self.shift = np.mean(v, axis=0)
+                vs = np.add(v, -self.shift)
+                elems = zmat['z'].tolist()
                 nelems = len(elems)
                 # define molecule radii and colors
                 r = []
@@ -544,27 +880,19 @@ class MainWidget(QWidget):
                 for i in elems:
                     r.append(elements[i].covalent_radius)
                     c.append(colors[i-1][-1])
-                # draw atoms
-                for i in range(nelems):
-                    addAtom(self.window, i, r, vs, c, fast=self.fast)
-                    self.atomList.append([i, self.window.items[-1]])
-                #print(self.atomList)
-                # draw bonds where appropriate
-                combs = list(itertools.combinations(range(nelems), 2))
-                bonds = []
-                for i in combs:
-                    bonds.append(addBond(self.window, i[0], i[1], r, vs, c, fast=self.fast))
-                if self.fast:
-                    bondedAtoms = set(filter((None).__ne__, flatten(bonds)))
-                    for i in set(range(nelems)) - bondedAtoms:
-                        addUnbonded(self.window, i, vs, c)
-                        self.atomList[i][1]=self.window.items[-1]
-                    #print(self.atomList)
+                # draw atoms and bonds where appropriate
+                with profiling.stage('bonds'):
+                    bonds = getBonds(vs, r)
+                self.window.setMolecule(vs, r, c, bonds, fast=self.fast)
 
                 for i in self.highList:
                     self.window.addItem(i[1])
                 for i in self.labelList:
                     self.window.addItem(i)
+            else:
+                self.window.clearMolecule()
+        if incremental:
+            return
         if len(v) > 1:
             maxDim = float('-inf')
             for dim in v.T:
@@ -574,110 +902,150 @@ class MainWidget(QWidget):
         else: maxDim = 2
         self.window.setCameraPosition(distance=maxDim*1.5+1)
 
-    global index
-    index = 0
+    @profiling.timed('updateFreq')
     def updateFreq(self):
-        global vsShifted, index, r, c
-        index += 1
-        index = index % len(vsShifted[0])
-        #print(index)
-        #print(vsShifted[index])
-        for item in reversed(self.window.items):
-            self.window.removeItem(item)
-        for i in range(nelems):
-            addAtom(self.window, i, r, vsShifted[self.freqIndex, index], c, fast=self.fast)
-            self.atomList.append([i, self.window.items[-1]])
-        combs = itertools.combinations(range(nelems), 2)
-        bonds = []
-        for i in combs:
-            bonds.append(addBond(self.window, i[0], i[1], r, vsShifted[self.freqIndex, index], c, fast=self.fast))
-        if self.fast:
-            bondedAtoms = set(filter((None).__ne__, flatten(bonds)))
-            for i in set(range(nelems)) - bondedAtoms:
-                addUnbonded(self.window, i, vsShifted[self.freqIndex, index], c)
-                self.atomList[i][1]=self.window.items[-1]
+        phase = 2*np.pi*self.vibClock.elapsed()/self.vibPeriod
+        self.window.setVibration(np.sin(phase))
 
     # detect mouse clicks in GL window and process them
     def eventFilter(self, obj, event):
         if obj == self.window:
             if event.type() == event.MouseButtonPress:
-                itms = obj.itemsAt((event.pos().x()-2, event.pos().y()-2, 4, 4))
-                if len(itms):
-                    self.highlight(obj, [itms[0]])
-                elif len(self.atomList) == 0:
+                idx = obj.atomAt(event.pos().x(), event.pos().y())
+                if idx is not None:
+                    self.highlight(obj, [idx])
+                elif len(obj.atomPos) == 0:
                     self.build()
         # also do the default click action
         return super(MainWidget, self).eventFilter(obj, event)
 
     def ZMatCellClicked(self):
         idxs = sorted(set(idx.row() for idx in self.ZMatTable.selectedIndexes()), reverse=True)
-        itms = []
-        if self.highList:
-            highIdx = list(np.array(self.highList).T[0])
-        for idx in idxs:
-            if self.highList and idx in highIdx:
-                itms.append(self.highList[highIdx.index(idx)][1])
-            elif len(self.atomList) > idx:
-                itms.append(self.atomList[idx][1])
-        self.highlight(self.window, itms)
+        self.highlight(self.window, [ idx for idx in idxs if idx < len(self.window.atomPos) ])
 
+    # animate the selected frequency; the displacements are handed to the
+    # GL view once and every timer tick only sets the phase
     def freqCellClicked(self):
-        global vsShifted
-        self.timer = QTimer()
-        self.timer.setInterval(30)
-        self.timer.timeout.connect(self.updateFreq)
-        idxs = [ idx.row() for idx in self.freqTable.selectedIndexes() ]
+        idxs = set( idx.row() for idx in self.freqTable.selectedIndexes() )
         if len(idxs) == 1:
-            self.freqIndex = idxs[0]
-            self.timer.stop()
-            self.timer.timeout.connect(self.updateFreq)
-            try:
-                self.ZMatModel.dataChanged.disconnect(self.clearUpdateView)
-            except TypeError:
-                pass
+            self.freqIndex = idxs.pop()
+            self.window.removeOverlays()
+            self.window.startVibration(np.asarray(self.vibdisps[self.freqIndex])*self.vibAmplitude)
+            self.vibClock.start()
             self.timer.start()
-        if len(idxs) != 1:
+        elif self.timer.isActive():
+            self.stopFreq()
+            self.clearUpdateView()
+
+    # coordinates of 'nframes' frames of one period of mode 'mode' around
+    # the shown geometry 'vs', made when first asked for; only the frames of
+    # the last mode are kept, so memory does not grow with the number of modes
+    def modeFrames(self, mode, nframes=100):
+        # the geometry is held on to, as ids of freed arrays get reused
+        if self.framesKey != (mode, nframes) or self.framesBase is not vs:
+            self.frames = None
+            self.frames = vibrationFrames(vs, self.vibdisps[mode], 2*np.pi*np.arange(nframes)/nframes, self.vibAmplitude)
+            self.framesKey = mode, nframes
+            self.framesBase = vs
+        return self.frames
+
+    # render the animated vibration, or else the geometries of the loaded
+    # Gaussian optimization, offscreen with the camera of the window
+    def exportAnimation(self):
+        if self.timer.isActive():
+            frames = self.modeFrames(self.freqIndex, 50)
+            bonds = getBonds(frames[0], r)
+            name = 'mode%03d' % (self.freqIndex+1)
+            duration = self.vibPeriod//len(frames)
+        elif self.logTail is not None and len(self.atomcoords) > 1:
+            # aligned onto the shown geometry like the playback, so they are
+            # where the copied camera looks
+            frames = np.asarray(self.atomcoords, dtype=float)
+            if len(frames[0]) == len(vs):
+                frames = alignFrames(frames, vs)
+            else:
+                frames = frames - frames.reshape(-1, 3).mean(axis=0)
+            bonds = None
+            name = 'optimization'
+            duration = 200
+        else:
+            self.statusBar.showMessage('Select a frequency or read a Gaussian optimization first.', 5000)
+            return
+        filename = self.fileDialog.getSaveFileName(self, 'Save file', expanduser('~')+'/'+name+'.gif', '*.gif;;*.png')
+        if not filename:
+            return
+        import render
+        size = (self.window.width(), self.window.height())
+        view = render.offscreenView(size, like=self.window, fast=self.fast)
+        images = render.renderFrames(view, frames, r, c, bonds, size)
+        try:
+            if filename.lower().endswith('.png'):
+                names = render.savePNGs(images, os.path.splitext(filename)[0]+'_%03d.png')
+            else:
+                names = render.saveGIF(list(images), filename, duration)
+        except ImportError:
+            self.statusBar.showMessage('Writing GIFs needs Pillow.', 5000)
+            return
+        finally:
+            view.close()
+            view.deleteLater()
+        self.statusBar.clearMessage()
+        self.statusBar.showMessage('Wrote '+str(len(names))+' file(s) to '+os.path.dirname(filename)+'.', 5000)
+
+    # stop the vibration; also called by the GL view when anything draws
+    # another molecule over it
+    def stopFreq(self):
+        if self.timer.isActive():
             self.timer.stop()
+            self.window.stopVibration()
             self.freqTable.clearSelection()
-            self.timer.timeout.disconnect(self.updateFreq)
-            self.ZMatModel.dataChanged.connect(self.clearUpdateView)
-            self.clearUpdateView()
 
     def gausclicked(self, item, point):
         itemdata = item.scatter.data
         points = [ row[7] for row in itemdata ]
         idx = points.index(point[0])
+        if self.playback.timer.isActive():
+            # while playing, clicks just move the playback
+            self.playback.setFrame(min(idx, len(self.atomcoords)-1)*self.playSubsteps)
+            return
+        self.gaussianStep(idx)
+        if self.playFrames is not None:
+            self.playback.blockSignals(True)
+            self.playback.setFrame(min(idx, len(self.atomcoords)-1)*self.playSubsteps)
+            self.playback.blockSignals(False)
+
+    # move the markers in the Gaussian plots to step 'idx'
+    def highlightStep(self, idx):
         for i in range(3):
             if i == 0:
                 x = [idx]
                 y = [self.scfenergies[idx]]
             else:
-                x = [idx, idx]
-                y = [self.geovalues[2*i-2][idx], self.geovalues[2*i-1][idx]]
-            plot = self.gaussianPlot.getItem(1, i+1)
-            plot.removeItem(plot.highlight)
-            plot.highlight=plot.plot(x, y, symbol='o', symbolPen='w', symbolBrush=None, pen=None, symbolSize=15, pxMode=True, antialias=True, autoDownsample=False)
-        self.ZMatModel.dataChanged.disconnect(self.clearUpdateView)
-        self.inp = []
-        self.populateZMatModel()
+                j = min(idx, len(self.geovalues[0])-1)
+                x = [j, j]
+                y = [self.geovalues[2*i-2][j], self.geovalues[2*i-1][j]]
+            self.gaussianPlot.getItem(1, i+1).highlight.setData(x, y)
+
+    # highlight step 'idx' of the Gaussian optimization and show its geometry
+    def gaussianStep(self, idx, incremental=False):
+        self.highlightStep(idx)
         self.inp = xyz2zmat(self.atomcoords[min(idx, len(self.atomcoords)-1)], self.atomsymbols)
-        self.populateZMatModel()
-        self.ZMatModel.dataChanged.connect(self.clearUpdateView)
-        self.updateView()
+        with self.redraw.bulk():
+            self.populateZMatModel()
+        self.updateView(incremental)
 
-    def highlight(self, obj, itms):
-        for itm in itms:
-            idx = next((i for i, sublist in enumerate(self.atomList) if itm in sublist), -1)
-            #print(idx)
-            if idx != -1:
+    # toggle highlighting of the atoms with indices 'idxs'
+    def highlight(self, obj, idxs):
+        for idx in idxs:
+            highIdx = [ h[0] for h in self.highList ]
+            if idx in highIdx:
+                obj.removeItem(self.highList[highIdx.index(idx)][1])
+                self.highList.pop(highIdx.index(idx))
+                self.ZMatTable.clearSelection()
+            else:
                 addAtom(obj, idx, r, vs, c, opt='highlight', fast=self.fast)
                 self.highList.append([idx, obj.items[-1]])
                 self.ZMatTable.selectRow(idx)
-            idx = next((i for i, sublist in enumerate(self.highList) if itm in sublist), -1)
-            if idx != -1:
-                obj.removeItem(self.highList[idx][1])
-                self.highList.pop(idx)
-                self.ZMatTable.clearSelection()
         self.statusBar.clearMessage()
         if len(self.highList) > 0:
             idxs = np.asarray(self.highList).T[0]
@@ -707,11 +1075,10 @@ class MainWidget(QWidget):
         selection = self.periodicTable()
         row = self.ZMatModel.rowCount()
         self.addRow()
-        self.ZMatModel.dataChanged.disconnect(self.clearUpdateView)
         newSymbol = selection[1]
         newData = [newSymbol]
         if len(self.highList) >= 1:
-            newBond = round(2.1*gmean([ elements[e].covalent_radius for e in [selection[0], elems[self.highList[0][0]]] ]), 4)
+            newBond = round(2.1*np.sqrt(np.prod([ elements[e].covalent_radius for e in [selection[0], elems[self.highList[0][0]]] ])), 4)
             newData.append(self.highList[0][0]+1)
             newData.append(newBond)
             if len(self.highList) >= 2:
@@ -722,11 +1089,9 @@ class MainWidget(QWidget):
                     newDihedral = 120.
                     newData.append(self.highList[2][0]+1)
                     newData.append(newDihedral)
-        for j, cell in enumerate(newData):
-            item = QStandardItem(str(cell))
-            self.ZMatModel.setItem(row, j, item)
+        with self.redraw.bulk():
+            self.ZMatModel.setRow(row, newData)
         self.highList = []
-        self.ZMatModel.dataChanged.connect(self.clearUpdateView)
         self.updateView()
 
     def measureDistanceB(self):
@@ -796,13 +1161,13 @@ class MainWidget(QWidget):
         self.window.labelPos = []
         self.window.labelText = []
         self.labelList = []
-        self.updateView()
+        self.updateView(incremental=True)
 
     def clearHighlights(self):
         for item in reversed(self.highList):
                 self.window.removeItem(item[1])
         self.highList = []
-        self.updateView()
+        self.updateView(incremental=True)
 
     def clearUpdateView(self):
         self.window.labelPos = []
@@ -811,7 +1176,7 @@ class MainWidget(QWidget):
         for item in reversed(self.highList):
                 self.window.removeItem(item[1])
         self.highList = []
-        self.updateView()
+        self.updateView(incremental=True)
         #print(self.highList)
 
     def fastDraw(self):
@@ -820,10 +1185,36 @@ class MainWidget(QWidget):
             self.updateView()
 
     def normalDraw(self):
+        self.window.setAutoDetail(False)
+        if self.fast:
+            self.fast = False
+            self.updateView()
+
+    def autoDraw(self):
+        self.window.setAutoDetail(True)
         if self.fast:
             self.fast = False
             self.updateView()
 
+    # profiling is started afresh every time it is switched on
+    def setProfiling(self, on):
+        if on:
+            profiling.reset()
+        profiling.enable(on)
+        self.window.update()
+        self.statusBar.clearMessage()
+        self.statusBar.showMessage('Profiling '+('on' if on else 'off')+'.', 3000)
+
+    def saveTrace(self):
+        if not profiling.events:
+            self.statusBar.showMessage('Nothing recorded; switch on View > Profile drawing first.', 5000)
+            return
+        filename = self.fileDialog.getSaveFileName(self, 'Save file', expanduser('~')+'/moldy_trace.json', '*.json;;*.*')
+        if filename:
+            n = profiling.dumpTrace(filename)
+            self.statusBar.clearMessage()
+            self.statusBar.showMessage('Wrote '+str(n)+' events to '+filename+'.', 5000)
+
     def about(self):
         QMessageBox.about(self, 'About moldy', 'moldy beta 15. 9. 2015')
 
@@ -835,6 +1226,11 @@ class MainWidget(QWidget):
         del self.window
 
 
-# run the application
-app = MainWidget()
-app.run()
+# create the Qt application and run it
+def main():
+    qt_app = QApplication(sys.argv)
+    app = MainWidget()
+    app.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# opt-in timing of the drawing stages. While 'enabled', every stage()
+# block is recorded as a complete event of the Chrome trace format (open
+# dumped traces in chrome://tracing or https://ui.perfetto.dev) and its
+# duration is averaged for the on-screen readout. Counts such as the
+# number of drawn vertices are kept with count(). Profiling starts enabled
+# if the environment variable MOLDY_PROFILE is set
+enabled = bool(os.environ.get('MOLDY_PROFILE'))
+maxEvents = 1 << 20
+events = deque(maxlen=maxEvents)
+timings = {}    # stage name -> [last, average] duration in ms
+counts = {}
+smoothing = .1
+origin = time.perf_counter()
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+def reset():
+    events.clear()
+    timings.clear()
+    counts.clear()
+
+def now():
+    return 1e6*(time.perf_counter()-origin)
+
+@contextmanager
+def stage(name, **args):
+    if not enabled:
+        yield
+        return
+    start = now()
+    try:
+        yield
+    finally:
+        end = now()
+        record(name, start, end, args)
+
+def record(name, start, end, args=None):
+    event = {'name': name, 'ph': 'X', 'ts': start, 'dur': end-start, 'pid': os.getpid(), 'tid': threading.current_thread().ident}
+    if args:
+        event['args'] = args
+    events.append(event)
+    ms = (end-start)/1e3
+    if name in timings:
+        timings[name] = [ms, timings[name][1] + smoothing*(ms - timings[name][1])]
+    else:
+        timings[name] = [ms, ms]
+
+def count(name, **values):
+    if not enabled:
+        return
+    counts.setdefault(name, {}).update(values)
+    events.append({'name': name, 'ph': 'C', 'ts': now(), 'pid': os.getpid(), 'args': values})
+
+# one line per stage with its last and average duration, then the counts
+def summary():
+    lines = [ '%-12s %7.2f ms  (avg %7.2f)' % (name, last, avg) for name, (last, avg) in sorted(timings.items()) ]
+    for name, values in sorted(counts.items()):
+        lines.append(name+': '+', '.join('%s %d' % kv for kv in sorted(values.items())))
+    return lines
+
+def dumpTrace(filename):
+    with open(filename, 'w') as f:
+        json.dump({'traceEvents': list(events), 'displayTimeUnit': 'ms'}, f)
+    return len(events)
+
+# decorator timing every call of a function as stage 'name'
+def timed(name):
+    def decorate(func):
+        @wraps(func)
+        def timedCall(*args, **kwds):
+            with stage(name):
+                return func(*args, **kwds)
+        return timedCall
+    return decorate
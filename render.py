@@ -0,0 +1,135 @@
+# coding=utf-8
+# offscreen rendering of vibrations and optimization paths from Gaussian
+# logs to PNG sequences or GIFs, e.g. for all modes of a frequency job:
+#
+#   python render.py --modes all --gif -o frames job.log
+#
+# frames are drawn by a MyGLView that is never shown on screen into a
+# framebuffer object (renderToArray). Qt still needs an X server, so on
+# machines without a display run it under Xvfb (xvfb-run python render.py).
+# Writing GIFs needs Pillow
+import argparse
+import os
+import sys
+import numpy as np
+from core import colors, getBonds, vibrationFrames
+
+# radii and colors of atoms with atomic numbers 'atomnos', as moldy draws them
+def atomStyle(atomnos):
+    from periodictable import elements
+    r = [ elements[int(z)].covalent_radius for z in atomnos ]
+    c = [ colors[int(z)-1][-1] for z in atomnos ]
+    return r, c
+
+# a MyGLView that renders without appearing on screen; the camera is
+# copied from 'like' if given
+def offscreenView(size=(640, 480), like=None, fast=False):
+    from PyQt4.QtCore import Qt
+    from widgets import MyGLView
+    view = MyGLView()
+    view.fast = fast
+    view.setAttribute(Qt.WA_DontShowOnScreen)
+    view.resize(*size)
+    view.show()
+    if like is not None:
+        view.opts.update(like.opts)
+    return view
+
+# point the camera at the origin from far enough away for all frames,
+# like MainWidget.updateView does for one molecule
+def fitCamera(view, frames):
+    frames = np.asarray(frames, dtype=float).reshape(-1, 3)
+    span = np.ptp(frames, axis=0).max() if len(frames) > 1 else 2
+    view.setCameraPosition(distance=span*1.5+1)
+
+# draw every (natoms, 3) coordinate array of 'frames' and yield the images
+# as BGRA arrays shaped (width, height, 4) as returned by renderToArray.
+# With 'bonds' given, the bonds are kept fixed; otherwise they are found
+# again for every frame
+def renderFrames(view, frames, r, c, bonds=None, size=(640, 480)):
+    for frame in frames:
+        view.setMolecule(frame, r, c, getBonds(frame, r) if bonds is None else bonds, fast=view.fast)
+        yield view.renderToArray(size)
+
+# save images to the files 'pattern' % 0, 'pattern' % 1, ...
+def savePNGs(images, pattern):
+    from pyqtgraph import makeQImage
+    names = []
+    for i, img in enumerate(images):
+        names.append(pattern % i)
+        makeQImage(img, alpha=False).save(names[-1])
+    return names
+
+# save images as a looping GIF showing each for 'duration' ms
+def saveGIF(images, filename, duration=60):
+    from PIL import Image
+    frames = [ Image.fromarray(np.ascontiguousarray(img.transpose(1, 0, 2)[..., 2::-1])) for img in images ]
+    frames[0].save(filename, save_all=True, append_images=frames[1:], duration=duration, loop=0)
+    return [filename]
+
+# one period of mode 'mode' around the last geometry of a Gaussian log,
+# centered like in the window
+def modeFrames(data, mode, nframes=50, amplitude=1/3.):
+    vs = np.asarray(data['atomcoords'][-1], dtype=float)
+    vs = vs - vs.mean(axis=0)
+    return vibrationFrames(vs, data['vibdisps'][mode], 2*np.pi*np.arange(nframes)/nframes, amplitude)
+
+# the geometries of an optimization, centered on the final one
+def pathFrames(data):
+    coords = np.asarray(data['atomcoords'], dtype=float)
+    return coords - coords[-1].mean(axis=0)
+
+def parseSize(text):
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render vibrations and optimization paths of Gaussian logs offscreen.')
+    parser.add_argument('log', help='Gaussian log file')
+    parser.add_argument('--modes', help="modes to render, numbered from 1 as in the frequency table, e.g. '1,4,7' or 'all'")
+    parser.add_argument('--path', action='store_true', help='render the optimization path')
+    parser.add_argument('-o', '--outdir', default='.', help='output directory (default: current directory)')
+    parser.add_argument('-n', '--frames', type=int, default=50, help='frames per vibration period (default: 50)')
+    parser.add_argument('--size', type=parseSize, default=(640, 480), help='image size as WIDTHxHEIGHT (default: 640x480)')
+    parser.add_argument('--gif', action='store_true', help='write GIFs instead of PNG sequences')
+    parser.add_argument('--fast', action='store_true', help='draw bonds as lines')
+    args = parser.parse_args(argv)
+    if not args.modes and not args.path:
+        parser.error('nothing to render; give --modes and/or --path')
+
+    from gaussian import readGaussianLog
+    data = readGaussianLog(args.log)
+    jobs = []
+    if args.modes:
+        if 'vibdisps' not in data:
+            parser.error(args.log+' has no frequencies')
+        nmodes = len(data['vibdisps'])
+        modes = range(nmodes) if args.modes == 'all' else [ int(m)-1 for m in args.modes.split(',') ]
+        for mode in modes:
+            if not 0 <= mode < nmodes:
+                parser.error('there are %d modes' % nmodes)
+            jobs.append(('mode%03d' % (mode+1), modeFrames(data, mode, args.frames), True))
+    if args.path:
+        jobs.append(('path', pathFrames(data), False))
+
+    from PyQt4.QtGui import QApplication
+    app = QApplication(sys.argv)
+    view = offscreenView(args.size, fast=args.fast)
+    r, c = atomStyle(data['atomnos'])
+    base = os.path.join(args.outdir, os.path.splitext(os.path.basename(args.log))[0])
+    if not os.path.isdir(args.outdir):
+        os.makedirs(args.outdir)
+    for name, frames, fixedBonds in jobs:
+        fitCamera(view, frames)
+        # vibrations keep the bonds of the equilibrium geometry
+        bonds = getBonds(frames[0], r) if fixedBonds else None
+        images = renderFrames(view, frames, r, c, bonds, args.size)
+        if args.gif:
+            saveGIF(list(images), base+'_'+name+'.gif')
+        else:
+            savePNGs(images, base+'_'+name+'_%03d.png')
+        sys.stderr.write('rendered %s\n' % name)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
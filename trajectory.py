@@ -0,0 +1,157 @@
+import mmap
+import os
+import struct
+import numpy as np
+
+# find the frames of a (multi-frame) XYZ file; returns the byte offset and
+# atom count of every frame. Newlines are located with numpy one chunk at a
+# time and whole frames are skipped by counting lines, so only the frame
+# headers are looked at from Python. Scanning can resume at the byte
+# offset 'start' of a known frame; 'progress' is called after every chunk
+def scanXYZ(buf, start=0, chunk=1 << 24, progress=None):
+    offsets, counts = [], []
+    size = len(buf)
+    skip = 0    # lines left in the current frame
+    for lo in range(start, size, chunk):
+        if progress:
+            progress(float(lo)/size, 'Indexing frames')
+        nl = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8, count=min(chunk, size-lo), offset=lo) == 10) + lo
+        k = 0
+        while k < len(nl):
+            if skip:
+                step = min(skip, len(nl)-k)
+                k += step
+                skip -= step
+                start = nl[k-1] + 1
+                continue
+            line = buf[start:nl[k]].strip()
+            # blank lines between frames are allowed
+            if line:
+                offsets.append(start)
+                counts.append(int(line))
+                skip = counts[-1] + 1
+            start = nl[k] + 1
+            k += 1
+    # the last atom line may lack its newline; anything shorter is a frame
+    # that is still being written
+    if skip > 1 or (skip == 1 and not buf[start:].strip()):
+        offsets.pop()
+        counts.pop()
+    return np.array(offsets, dtype=np.int64), np.array(counts, dtype=np.int64)
+
+# frame indexes of large trajectories are kept next to them in
+# '<filename>.idx' so that reopening skips the scan. The header records the
+# size and mtime of the file the index was built for; if the file has only
+# grown since, scanning resumes at the last indexed frame
+indexMagic = b'MOLDYIDX'
+indexVersion = 1
+indexHeader = struct.Struct('<8sIqqq')    # magic, version, size, mtime, frames
+indexMinSize = 1 << 20
+
+def indexPath(filename):
+    return filename + '.idx'
+
+def loadIndex(filename):
+    try:
+        with open(indexPath(filename), 'rb') as f:
+            magic, version, size, mtime, n = indexHeader.unpack(f.read(indexHeader.size))
+            data = np.fromfile(f, dtype='<i8', count=2*n)
+    except (IOError, OSError, struct.error):
+        return None
+    if magic != indexMagic or version != indexVersion or len(data) != 2*n:
+        return None
+    return size, mtime, data[:n], data[n:]
+
+def saveIndex(filename, size, mtime, offsets, counts):
+    path = indexPath(filename)
+    try:
+        with open(path+'.tmp', 'wb') as f:
+            f.write(indexHeader.pack(indexMagic, indexVersion, size, mtime, len(offsets)))
+            np.concatenate([offsets, counts]).astype('<i8').tofile(f)
+        os.replace(path+'.tmp', path)
+    except (IOError, OSError):
+        # the directory may be read-only; the file is just scanned next time
+        pass
+
+# scan 'buf' for frames, reusing the stored index of 'filename' if it is
+# still valid and updating it otherwise
+def indexXYZ(filename, buf, size, mtime, progress=None):
+    index = loadIndex(filename)
+    if index and index[:2] == (size, mtime):
+        return index[2], index[3]
+    offsets, counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    start = 0
+    if index and index[0] <= size and len(index[2]):
+        # the file grew; keep the frames before the last indexed one if its
+        # header still matches and rescan from there
+        last = index[2][-1]
+        end = buf.find(b'\n', last)
+        try:
+            if end != -1 and int(buf[last:end]) == index[3][-1]:
+                offsets, counts = index[2][:-1], index[3][:-1]
+                start = last
+        except ValueError:
+            pass
+    more = scanXYZ(buf, start, progress=progress)
+    offsets, counts = np.concatenate([offsets, more[0]]), np.concatenate([counts, more[1]])
+    if size >= indexMinSize and len(offsets) > 1:
+        saveIndex(filename, size, mtime, offsets, counts)
+    return offsets, counts
+
+# parse the atom lines of one frame into element symbols and coordinates;
+# lines with fewer than 4 columns are skipped, extra columns are ignored
+def parseXYZAtoms(body, natoms=None):
+    tokens = body.split()
+    if natoms is not None and len(tokens) == 4*natoms:
+        rows = np.array(tokens).reshape(-1, 4)
+    else:
+        rows = np.array([ row.split()[:4] for row in body.splitlines() if len(row.split()) >= 4 ][:natoms]).reshape(-1, 4)
+    elems = [ e.decode() for e in rows[:, 0] ]
+    return elems, rows[:, 1:].astype(float)
+
+# multi-frame XYZ file read through a memory map; the frame index is built
+# once when opening and frames are parsed only when they are accessed, so
+# files larger than memory can be scrubbed through
+class XYZTrajectory(object):
+    def __init__(self, filename, progress=None):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        stat = os.fstat(self.file.fileno())
+        if stat.st_size:
+            self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.buf = b''
+        try:
+            self.offsets, self.natoms = indexXYZ(filename, self.buf, stat.st_size, stat.st_mtime_ns, progress)
+        except ValueError:
+            # no usable atom counts; read the file like a single frame
+            self.offsets, self.natoms = np.zeros(1, dtype=np.int64), np.full(1, -1)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    # element symbols and an (natoms, 3) coordinate array of frame i
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('frame %d out of range' % i)
+        start = self.offsets[i]
+        end = self.offsets[i+1] if i+1 < len(self) else len(self.buf)
+        # skip the atom count and comment lines
+        for j in range(2):
+            nl = self.buf.find(b'\n', start, end)
+            start = end if nl == -1 else nl + 1
+        natoms = self.natoms[i] if self.natoms[i] >= 0 else None
+        return parseXYZAtoms(self.buf[start:end], natoms)
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -13,49 +13,36 @@
 
 # Standard library modules.
 import math
-
-import csv
+import time
+from contextlib import contextmanager
 
 # Third party modules.
 from PyQt4.QtGui import \
     (QWidget, QDialog, QPushButton, QGridLayout, QColor, QFont,
      QLabel, QSizePolicy, QButtonGroup, QDialogButtonBox, QVBoxLayout,
-     QStyleFactory, QFrame)
-from PyQt4.QtCore import Qt, QSize, pyqtSignal
+     QStyleFactory, QFrame, QHBoxLayout, QSlider, QSpinBox)
+from PyQt4.QtCore import Qt, QSize, QObject, QThread, QTimer, pyqtSignal, QAbstractTableModel, QModelIndex
 
 import sys
 from PyQt4.QtGui import QApplication
 
+import numpy as np
 import pyqtgraph.opengl as gl
-from pyqtgraph import GraphicsLayoutWidget
+from pyqtgraph import GraphicsLayoutWidget, transformToArray
+
+from periodictable import elements
 
 # Local modules.
-from pyhmsa.util.element_properties import get_symbol, get_atomic_number
-
-from cclib.parser import ccopen
-
-# PyInstaller external file fix
-from os.path import join
-from os import chdir
-filename = 'colors.csv'
-if hasattr(sys, '_MEIPASS'):
-    # PyInstaller >= 1.6
-    chdir(sys._MEIPASS)
-    filename = join(sys._MEIPASS, filename)
-elif '_MEIPASS2' in environ:
-    # PyInstaller < 1.6 (tested on 1.5 only)
-    chdir(environ['_MEIPASS2'])
-    filename = join(environ['_MEIPASS2'], filename)
-else:
-    chdir(dirname(sys.argv[0]))
-    filename = join(dirname(sys.argv[0]), filename)
+from utils import bondDtype, meshData, sphereVerts, cylinderVerts, sphereTemplate, cylinderTemplate, batchAtoms, batchBonds, batchLines, bondSegments
+import core
+import profiling
 
 class ElementPushButton(QPushButton):
     def __init__(self, atomic_number, parent=None):
         QPushButton.__init__(self, parent)
 
         self._atomic_number = atomic_number
-        self._symbol = get_symbol(atomic_number)
+        self._symbol = elements[atomic_number].symbol
 
         self.setText(self._symbol)
 
@@ -110,11 +97,7 @@ _ELEMENT_POSITIONS = \
      113: (6, 12), 114: (6, 13), 115: (6, 14), 116: (6, 15), 117: (6, 16),
      118: (6, 17)}
 
-colors = []
-with open('colors.csv') as csvfile:
-    csvreader = csv.reader(csvfile)
-    for row in csvreader:
-        colors.append([int(row[0]),row[1],QColor(int(row[2]),int(row[3]),int(row[4]))])
+colors = [ [z, symbol, QColor.fromRgbF(*color)] for z, symbol, color in core.colors ]
 
 def _category_color_function(z):
     return colors[min(len(colors)-1, z-1)][-1]
@@ -190,7 +173,7 @@ class PeriodicTableWidget(QWidget):
             if widget.isChecked():
                 selection = self._group.id(widget)
         if selection != None:
-            return [selection, get_symbol(selection)]
+            return [selection, elements[selection].symbol]
         else:
             return None
 
@@ -231,17 +214,595 @@ class PeriodicTableDialog(QDialog):
         return self._wdg_table.selectionSymbol()
 
 class MyGLView(gl.GLViewWidget):
-    def __init__(self, labelPos=[], labelText=[]):
+    # sphere rows and columns and cylinder sides of the mesh detail levels,
+    # from coarse to fine; normal drawing uses 'normalLevel'. With automatic
+    # detail the level follows the molecule size, zoom and frame time
+    detailLevels = [(4, 8, 6), (6, 12, 8), (8, 16, 10), (10, 20, 12), (14, 28, 16), (20, 40, 24)]
+    normalLevel = 3
+    maxVertices = 2000000
+    frameBudget = 1000/30.
+    # emitted when a new molecule ends a vibration, so that whatever
+    # drives it can stop too
+    vibrationStopped = pyqtSignal()
+    def __init__(self, labelPos=None, labelText=None):
             super(MyGLView, self).__init__()
-            self.labelText = labelText
-            self.labelPos = labelPos
+            # every view has lists of its own
+            self.labelText = labelText if labelText is not None else []
+            self.labelPos = labelPos if labelPos is not None else []
+            self.atomItem = None
+            self.bondItem = None
+            self.atomMesh = None
+            self.bondMesh = None
+            self.atomPos = np.zeros((0, 3))
+            self.atomRadii = np.zeros(0)
+            self.atomColors = np.zeros((0, 4))
+            self.bonds = np.zeros(0, dtype=bondDtype)
+            self.fast = False
+            self.detail = self.normalLevel
+            self.bondDetail = self.detailLevels[self.detail][2]
+            self.autoDetail = False
+            self.impostors = False
+            self.frameTime = None
+            self.detailTimer = QTimer(self)
+            self.detailTimer.setSingleShot(True)
+            self.detailTimer.setInterval(250)
+            self.detailTimer.timeout.connect(self.applyDetail)
+            self.vibDisp = None
+            self.vibAtoms = None
+            self.vibBonds = None
+    @property
+    def moleculeItems(self):
+            return [ item for item in (self.atomItem, self.bondItem) if item is not None ]
+    # remove highlights, labels and everything else drawn over the molecule
+    def removeOverlays(self):
+            for item in reversed(self.items):
+                if item not in self.moleculeItems:
+                    self.removeItem(item)
+    # draw the molecule with one item for all atoms and one for all bonds
+    # instead of a separate item for every atom and bond. If only coordinates
+    # or bonds changed since the last call, just the atoms that moved and the
+    # bonds touching them are updated in the existing buffers
+    @profiling.timed('setMolecule')
+    def setMolecule(self, vs, r, c, bonds, fast=False):
+            vs = np.asarray(vs, dtype=float).reshape(-1, 3)
+            c = np.asarray(c, dtype=float).reshape(-1, 4)
+            radii = np.full(len(vs), .12) if fast else np.asarray(r, dtype=float)*.6
+            # a new geometry ends any vibration, restoring the meshes first
+            # so that they can be updated incrementally
+            if self.vibDisp is not None:
+                self.stopVibration()
+                self.vibrationStopped.emit()
+            if len(vs) and fast == self.fast and len(vs) == len(self.atomPos) and \
+                    np.array_equal(radii, self.atomRadii) and np.array_equal(c, self.atomColors):
+                self.updateMolecule(vs, bonds)
+            else:
+                self.atomPos, self.atomRadii, self.atomColors = vs, radii, c
+                self.bonds = bonds
+                self.fast = fast
+                if self.autoDetail and not fast:
+                    self.detail = self.chooseDetail()
+                self.impostors = self.useImpostors()
+                self.buildAtoms()
+                self.buildBonds()
+    def clearMolecule(self):
+            self.setMolecule(np.zeros((0, 3)), [], [], np.zeros(0, dtype=bondDtype), self.fast)
+    def updateMolecule(self, vs, bonds):
+            moved = np.flatnonzero(np.any(vs != self.atomPos, axis=1))
+            bondsChanged = not (np.array_equal(bonds['i'], self.bonds['i']) and np.array_equal(bonds['j'], self.bonds['j']))
+            self.atomPos = vs
+            self.bonds = bonds
+            # in fast mode the set of drawn atoms depends on bonding
+            if self.fast and bondsChanged:
+                self.buildAtoms()
+            elif len(moved):
+                self.updateAtoms(moved)
+            if bondsChanged:
+                self.buildBonds()
+            elif len(moved):
+                self.updateBonds(moved)
+    # replace a molecule item in the scene
+    def swapItem(self, old, new):
+            if old is not None and old in self.items:
+                self.removeItem(old)
+            if new is not None:
+                self.addItem(new)
+            return new
+    def buildAtoms(self):
+            if self.impostors:
+                import impostor
+                self.atomSlot = np.arange(len(self.atomPos))
+                self.atomMesh = None
+                self.atomItem = self.swapItem(self.atomItem, impostor.SphereImpostors(self.atomPos, self.atomRadii, self.atomColors))
+                return
+            drawn = np.ones(len(self.atomPos), dtype=bool)
+            if self.fast:
+                # only unbonded atoms are drawn as dots, bonds are lines
+                drawn[self.bonds['i']] = False
+                drawn[self.bonds['j']] = False
+                self.atomDetail = (2, 3)
+            else:
+                self.atomDetail = self.detailLevels[self.detail][:2]
+            self.atomSlot = np.cumsum(drawn) - 1
+            self.atomSlot[~drawn] = -1
+            self.atomMesh = item = None
+            if drawn.any():
+                with profiling.stage('atomMesh', atoms=int(drawn.sum())):
+                    self.atomMesh = batchAtoms(self.atomPos[drawn], self.atomRadii[drawn], self.atomColors[drawn], *self.atomDetail)
+                ms = meshData(*self.atomMesh)
+                if self.fast:
+                    item = gl.GLMeshItem(meshdata=ms, smooth=False, drawFaces=True, drawEdges=False)
+                else:
+                    item = gl.GLMeshItem(meshdata=ms, smooth=True, drawFaces=True, drawEdges=False, shader='shaded', glOptions='opaque')
+            self.atomItem = self.swapItem(self.atomItem, item)
+    def updateAtoms(self, moved):
+            if self.impostors:
+                self.atomItem.data['pos'][moved] = self.atomPos[moved]
+                self.atomItem.dataChanged('pos')
+                return
+            moved = moved[self.atomSlot[moved] >= 0]
+            if len(moved) == 0:
+                return
+            verts = self.atomMesh[0]
+            verts[self.atomSlot[moved]] = sphereVerts(self.atomPos[moved], self.atomRadii[moved], *self.atomDetail)
+            self.atomItem.setMeshData(meshdata=meshData(*self.atomMesh))
+    def buildBonds(self):
+            self.bondDetail = self.detailLevels[self.detail][2]
+            starts, ends, colors, self.bondOwner = bondSegments(self.atomPos, self.bonds, self.atomRadii, self.atomColors, self.fast)
+            self.bondMesh = item = None
+            if len(starts):
+                if self.impostors:
+                    import impostor
+                    item = impostor.CylinderImpostors(starts, ends, colors)
+                elif self.fast:
+                    self.bondMesh = batchLines(starts, ends, colors)
+                    item = gl.GLLinePlotItem(pos=self.bondMesh[0].reshape(-1, 3), color=self.bondMesh[1].reshape(-1, 4), width=3, mode='lines')
+                else:
+                    with profiling.stage('bondMesh', bonds=len(starts)):
+                        self.bondMesh = batchBonds(starts, ends, colors, cols=self.bondDetail)
+                    item = gl.GLMeshItem(meshdata=meshData(*self.bondMesh), smooth=True, drawFaces=True, drawEdges=False, shader='shaded')
+            self.bondItem = self.swapItem(self.bondItem, item)
+    def updateBonds(self, moved):
+            changed = np.flatnonzero(np.isin(self.bonds['i'], moved) | np.isin(self.bonds['j'], moved))
+            if len(changed) == 0:
+                return
+            # segments of the changed bonds, in the order bondSegments returns them
+            sel = np.flatnonzero(np.isin(self.bondOwner, changed))
+            starts, ends = bondSegments(self.atomPos, self.bonds[changed], self.atomRadii, self.atomColors, self.fast)[:2]
+            if self.impostors:
+                segments = self.bondItem.data['ends']
+                segments[sel, 0] = starts
+                segments[sel, 1] = ends
+                self.bondItem.dataChanged('ends')
+            elif self.fast:
+                pos = self.bondMesh[0]
+                pos[sel, 0] = starts
+                pos[sel, 1] = ends
+                self.bondItem.setData(pos=pos.reshape(-1, 3))
+            else:
+                verts, normals = self.bondMesh[0], self.bondMesh[2]
+                verts[sel], normals[sel] = cylinderVerts(starts, ends, cols=self.bondDetail)
+                self.bondItem.setMeshData(meshdata=meshData(*self.bondMesh))
+    # vibration animation; the meshes are built once and every frame only
+    # moves their vertices along displacement buffers computed when it
+    # starts, verts = base + s*disp, so bonds keep their topology. Bond
+    # cylinders are stretched and sheared with their end points instead of
+    # being rebuilt, which is close enough for the small amplitudes of modes.
+    # Mesh vertices are computed into a buffer of our own and handed to the
+    # mesh data with setVertexes()
+    def startVibration(self, disp):
+            self.stopVibration()
+            disp = np.asarray(disp, dtype=float).reshape(-1, 3)
+            self.vibDisp = disp
+            if self.impostors:
+                # impostors move with their centres and end points
+                self.vibAtoms = self.atomItem.data['pos'].copy(), disp, self.atomItem.data['pos'], None
+            elif self.atomMesh is not None:
+                verts = self.atomMesh[0]
+                md = meshData(*self.atomMesh)
+                self.atomItem.setMeshData(meshdata=md)
+                self.vibAtoms = verts.copy(), np.broadcast_to(disp[self.atomSlot >= 0][:, None], verts.shape), verts.copy(), md
+            if self.bondMesh is not None or self.impostors and self.bondItem is not None:
+                starts, ends = bondSegments(self.atomPos, self.bonds, self.atomRadii, self.atomColors, self.fast)[:2]
+                starts1, ends1 = bondSegments(self.atomPos+disp, self.bonds, self.atomRadii, self.atomColors, self.fast)[:2]
+                ds, de = starts1-starts, ends1-ends
+                if self.impostors:
+                    segments = self.bondItem.data['ends']
+                    self.vibBonds = segments.copy(), np.stack([ds, de], axis=1), segments, None
+                elif self.fast:
+                    verts = self.bondMesh[0]
+                    self.vibBonds = verts.copy(), np.stack([ds, de], axis=1), verts, None
+                else:
+                    verts = self.bondMesh[0]
+                    # cylinder vertices follow the end point they lie at
+                    z = cylinderTemplate(self.bondDetail)[0][:, 2, None]
+                    md = meshData(*self.bondMesh)
+                    self.bondItem.setMeshData(meshdata=md)
+                    self.vibBonds = verts.copy(), ds[:, None]*(1-z) + de[:, None]*z, verts.copy(), md
+    # show the vibration at displacement 's', from -1 to 1
+    def setVibration(self, s):
+            if self.vibAtoms is not None:
+                base, disp, out, md = self.vibAtoms
+                np.multiply(disp, s, out=out)
+                out += base
+                if self.impostors:
+                    self.atomItem.dataChanged('pos')
+                else:
+                    md.setVertexes(out.reshape(-1, 3))
+                    self.atomItem.meshDataChanged()
+            if self.vibBonds is not None:
+                base, disp, out, md = self.vibBonds
+                np.multiply(disp, s, out=out)
+                out += base
+                if self.impostors:
+                    self.bondItem.dataChanged('ends')
+                elif self.fast:
+                    self.bondItem.setData(pos=out.reshape(-1, 3))
+                else:
+                    md.setVertexes(out.reshape(-1, 3))
+                    self.bondItem.meshDataChanged()
+    def stopVibration(self):
+            if self.vibAtoms is not None or self.vibBonds is not None:
+                self.setVibration(0)
+            self.vibDisp = self.vibAtoms = self.vibBonds = None
+    # find the atom under a widget position by projecting the atom centres;
+    # returns the index of the hit atom nearest to the camera or None
+    def atomAt(self, x, y):
+            if len(self.atomPos) == 0:
+                return None
+            proj = transformToArray(self.projectionMatrix())
+            m = proj.dot(transformToArray(self.viewMatrix()))
+            p = np.c_[self.atomPos, np.ones(len(self.atomPos))].dot(m.T)
+            w = p[:, 3]
+            sx = (p[:, 0]/w + 1)*self.width()/2
+            sy = (1 - p[:, 1]/w)*self.height()/2
+            pix = np.maximum(self.atomRadii*proj[0, 0]*self.width()/2/w, 4)
+            hits = np.flatnonzero((w > 0) & ((sx-x)**2 + (sy-y)**2 < pix**2))
+            if len(hits) == 0:
+                return None
+            return int(hits[np.argmin(p[hits, 2]/w[hits])])
     def setText(self, text):
             self.text = text
             self.update()
+    # automatic level of detail. The finest level that is worth drawing
+    # keeps the polygon edges of a typical atom within half a pixel of the
+    # true outline at the current zoom; from there it is lowered until the
+    # meshes fit in 'maxVertices' and, going by the time the last frames
+    # took per vertex, can be drawn within 'frameBudget' ms
+    def setAutoDetail(self, on):
+            self.autoDetail = on
+            self.frameTime = None
+            self.setDetail(self.chooseDetail() if on else self.normalLevel)
+    # above what the coarsest meshes can hold, atoms and bonds are drawn
+    # as impostors (see impostor.py)
+    def useImpostors(self):
+            return self.autoDetail and not self.fast and self.meshVertices(0) > self.maxVertices
+    def setDetail(self, level):
+            impostors = self.useImpostors()
+            if impostors:
+                level = self.detail
+            if level != self.detail or impostors != self.impostors:
+                # a vibration goes on with the new meshes
+                disp = self.vibDisp
+                self.stopVibration()
+                self.detail = level
+                self.impostors = impostors
+                # frame times of the old meshes say little about the new ones
+                self.frameTime = None
+                if len(self.atomPos) and not self.fast:
+                    self.buildAtoms()
+                    self.buildBonds()
+                if disp is not None:
+                    self.startVibration(disp)
+    # vertices of the molecule meshes at detail level 'level'
+    def meshVertices(self, level):
+            rows, cols, sides = self.detailLevels[level]
+            return len(sphereTemplate(rows, cols)[0])*len(self.atomPos) + len(cylinderTemplate(sides)[0])*2*len(self.bonds)
+    # radius in pixels of a typical atom in the centre of the view
+    def pixelRadius(self):
+            if len(self.atomRadii) == 0:
+                return 0.
+            scale = self.height()/2/(self.opts['distance']*math.tan(math.radians(self.opts['fov'])/2))
+            return float(np.median(self.atomRadii))*scale
+    def chooseDetail(self):
+            level = next((i for i, l in enumerate(self.detailLevels) if l[1] >= math.pi*math.sqrt(self.pixelRadius())), len(self.detailLevels)-1)
+            while level > 0 and self.meshVertices(level) > self.maxVertices:
+                level -= 1
+            if self.frameTime is not None and self.meshVertices(self.detail):
+                perVertex = self.frameTime/self.meshVertices(self.detail)
+                while level > 0 and perVertex*self.meshVertices(level) > self.frameBudget:
+                    level -= 1
+            return level
+    # re-evaluate the detail a little after the view changed, so that
+    # zooming or rotating doesn't rebuild the meshes on every frame
+    def scheduleDetail(self):
+            if self.autoDetail and not self.detailTimer.isActive():
+                self.detailTimer.start()
+    def applyDetail(self):
+            # meshes aren't swapped under a running vibration
+            if self.autoDetail and not self.fast and self.vibAtoms is None and self.vibBonds is None:
+                self.setDetail(self.chooseDetail())
+    def setCameraPosition(self, *args, **kwds):
+            gl.GLViewWidget.setCameraPosition(self, *args, **kwds)
+            self.scheduleDetail()
+    # number of vertices in the molecule buffers
+    def vertexCount(self):
+            if self.impostors:
+                return sum( item.vertexCount() for item in self.moleculeItems )
+            return sum( mesh[0].size//3 for mesh in (self.atomMesh, self.bondMesh) if mesh is not None )
     def paintGL(self, *args, **kwds):
-            gl.GLViewWidget.paintGL(self, *args, **kwds)
-            for i in range(len(self.labelPos)):
-                self.renderText(self.labelPos[i][0], self.labelPos[i][1], self.labelPos[i][2], self.labelText[i])
+            start = time.perf_counter()
+            with profiling.stage('paintGL'):
+                gl.GLViewWidget.paintGL(self, *args, **kwds)
+                for i in range(len(self.labelPos)):
+                    self.renderText(self.labelPos[i][0], self.labelPos[i][1], self.labelPos[i][2], self.labelText[i])
+            if self.autoDetail:
+                ms = 1e3*(time.perf_counter()-start)
+                self.frameTime = ms if self.frameTime is None else .8*self.frameTime + .2*ms
+                self.scheduleDetail()
+            # timings of the last frames in the top left corner
+            if profiling.enabled:
+                profiling.count('scene', items=len(self.items), vertices=self.vertexCount())
+                for i, line in enumerate(profiling.summary()):
+                    self.renderText(8, 16+14*i, line)
+
+# table model of the Zmatrix. The cells are served from a structured
+# array (see core.zmatDtype) instead of holding one item per cell, so
+# large molecules load quickly and the coordinates are read from the array
+# without converting text. Reference atoms are shown 1-based; cells the
+# first three atoms don't use are greyed out and can't be edited
+class ZMatModel(QAbstractTableModel):
+    headers = ['atom','','bond','','angle','','dihedral']
+    unused = QColor(150,150,150)
+    def __init__(self, parent=None):
+        QAbstractTableModel.__init__(self, parent)
+        self.zmat = core.emptyZmat(0)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.zmat)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def isUsed(self, row, col):
+        return (col+1)//2 <= row
+
+    def data(self, index, role=Qt.DisplayRole):
+        row, col = index.row(), index.column()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            if col == 0:
+                z = int(self.zmat['z'][row])
+                return core.colors[z-1][1] if z > 0 else ''
+            elif col % 2 == 1:
+                ref = int(self.zmat['refs'][row, col//2])
+                return str(ref+1) if ref >= 0 else ''
+            else:
+                value = float(self.zmat['values'][row, col//2-1])
+                return '' if np.isnan(value) else str(value)
+        elif role == Qt.BackgroundRole and not self.isUsed(row, col):
+            return self.unused
+        return None
+
+    def flags(self, index):
+        if not self.isUsed(index.row(), index.column()):
+            return Qt.ItemIsEnabled
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    # parse edited text into the array; text that doesn't fit the column
+    # is rejected and the cell keeps its value
+    def setData(self, index, value, role=Qt.EditRole):
+        if role != Qt.EditRole or not index.isValid():
+            return False
+        row, col = index.row(), index.column()
+        text = str(value).strip()
+        try:
+            if col == 0:
+                z = core.elementNumber(text) if text else 0
+                if text and not z:
+                    return False
+                self.zmat['z'][row] = z
+            elif col % 2 == 1:
+                self.zmat['refs'][row, col//2] = int(text)-1 if text else -1
+            else:
+                self.zmat['values'][row, col//2-1] = float(text) if text else np.nan
+        except ValueError:
+            return False
+        self.dataChanged.emit(index, index)
+        return True
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section]
+        return str(section+1)
+
+    def insertRows(self, row, count, parent=QModelIndex()):
+        self.beginInsertRows(parent, row, row+count-1)
+        self.zmat = np.insert(self.zmat, row, core.emptyZmat(count))
+        self.endInsertRows()
+        return True
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        if count <= 0 or row < 0 or row+count > len(self.zmat):
+            return False
+        self.beginRemoveRows(parent, row, row+count-1)
+        self.zmat = np.delete(self.zmat, np.s_[row:row+count])
+        self.endRemoveRows()
+        return True
+
+    # replace the contents with Zmatrix rows as read from files
+    def setZmat(self, data):
+        self.beginResetModel()
+        self.zmat = core.zmat2array(data)
+        self.endResetModel()
+
+    # set row 'row' from a Zmatrix row as read from files
+    def setRow(self, row, data):
+        self.zmat[row] = core.zmat2array([data])[0]
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount()-1))
+
+    # the filled rows as an array and as Zmatrix rows
+    def filled(self):
+        return self.zmat[core.filledRows(self.zmat)]
+
+    def toList(self):
+        return core.array2zmat(self.filled())
+
+# coalesces redraw requests: 'redraw' is called once for any number of
+# schedule() calls made within 'delay' ms (0 waits for the event loop).
+# While blocked, e.g. inside a bulk() block, requests are only remembered
+# and a single redraw is scheduled when the last block ends
+class RedrawScheduler(QObject):
+    def __init__(self, redraw, delay=0, parent=None):
+        QObject.__init__(self, parent)
+        self.redraw = redraw
+        self.pending = False
+        self.blocked = 0
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.flush)
+
+    # takes any arguments so that it can be connected to any signal
+    def schedule(self, *args):
+        self.pending = True
+        if not self.blocked:
+            self.timer.start()
+
+    # redraw now if anything is pending
+    def flush(self):
+        self.timer.stop()
+        if self.pending and not self.blocked:
+            self.pending = False
+            self.redraw()
+
+    # forget pending requests, e.g. because the caller redraws itself
+    def cancel(self):
+        self.timer.stop()
+        self.pending = False
+
+    def block(self):
+        self.blocked += 1
+        self.timer.stop()
+
+    def unblock(self):
+        self.blocked = max(self.blocked-1, 0)
+        if self.pending and not self.blocked:
+            self.timer.start()
+
+    @contextmanager
+    def bulk(self):
+        self.block()
+        try:
+            yield self
+        finally:
+            self.unblock()
+
+# play/pause button, scrub slider and smoothing box for stepping through
+# precomputed frames; 'frameChanged' is emitted for every frame shown,
+# 'settled' with the frame playback comes to rest at, when pausing or
+# letting go of the slider, and 'smoothingChanged' when the number of frames
+# per step is changed
+class PlaybackBar(QWidget):
+    frameChanged = pyqtSignal(int)
+    settled = pyqtSignal(int)
+    smoothingChanged = pyqtSignal(int)
+    def __init__(self, parent=None, fps=30):
+        QWidget.__init__(self, parent)
+        self.playButton = QPushButton('Play')
+        self.playButton.setCheckable(True)
+        self.playButton.toggled.connect(self.setPlaying)
+        self.slider = QSlider(Qt.Horizontal)
+        self.slider.valueChanged.connect(self.frameChanged)
+        self.slider.valueChanged.connect(self.settle)
+        self.slider.sliderReleased.connect(self.settle)
+        self.smoothBox = QSpinBox()
+        self.smoothBox.setRange(1, 20)
+        self.smoothBox.setPrefix('x')
+        self.smoothBox.setToolTip('Frames per step')
+        self.smoothBox.valueChanged.connect(self.smoothingChanged)
+        self.label = QLabel()
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(1, 1, 1, 1)
+        layout.addWidget(self.playButton)
+        layout.addWidget(self.slider)
+        layout.addWidget(self.smoothBox)
+        layout.addWidget(self.label)
+        self.timer = QTimer(self)
+        self.timer.setInterval(1000//fps)
+        self.timer.timeout.connect(self.advance)
+
+    def frame(self):
+        return self.slider.value()
+
+    # set the number of frames; 'frameChanged' is emitted only if the
+    # current frame changes
+    def setFrameCount(self, n):
+        self.slider.setRange(0, max(n-1, 0))
+
+    def setFrame(self, i):
+        self.slider.setValue(i)
+
+    def setPlaying(self, playing):
+        self.playButton.setChecked(playing)
+        self.playButton.setText('Pause' if playing else 'Play')
+        if playing:
+            self.timer.start()
+            # play from the start again once at the end
+            if self.frame() == self.slider.maximum():
+                self.setFrame(0)
+        elif self.timer.isActive():
+            self.timer.stop()
+            self.settle()
+
+    # frames passed while playing or dragging are not at rest
+    def settle(self):
+        if not self.timer.isActive() and not self.slider.isSliderDown():
+            self.settled.emit(self.frame())
+
+    def advance(self):
+        if self.frame() >= self.slider.maximum():
+            self.setPlaying(False)
+        else:
+            self.setFrame(self.frame()+1)
+
+# raised by the progress callback of a cancelled FileLoader
+class LoadCancelled(Exception):
+    pass
+
+# runs 'func(filename, progress)' in a worker thread. 'progress' takes a
+# fraction and a message and is passed on as a signal; after cancel() it
+# raises LoadCancelled to stop the reader. The result of 'func' is sent
+# with the loaded signal, errors with failed
+class FileLoader(QThread):
+    progress = pyqtSignal(int, str)
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    def __init__(self, func, filename, parent=None):
+        QThread.__init__(self, parent)
+        self.func = func
+        self.filename = filename
+        self.cancelled = False
+        self.percent = -1
+    def cancel(self):
+        self.cancelled = True
+    def report(self, fraction, text=''):
+        if self.cancelled:
+            raise LoadCancelled()
+        percent = int(100*fraction)
+        if percent != self.percent:
+            self.percent = percent
+            self.progress.emit(percent, text)
+    def run(self):
+        try:
+            result = self.func(self.filename, self.report)
+        except LoadCancelled:
+            self.failed.emit('Loading '+self.filename+' cancelled.')
+        except Exception as e:
+            self.failed.emit('Could not read '+self.filename+': '+str(e))
+        else:
+            if not self.cancelled:
+                self.loaded.emit(result)
 
 def run():
     app = QApplication(sys.argv)